@@ -0,0 +1,105 @@
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncHour
+from django.utils import timezone
+
+from api.models import Bug, BugDailyCount, Log, LogHourlyCount
+
+# source model: (rollup model, bucket field, truncation, grouped code fields)
+ROLLUPS = {
+    Bug: (BugDailyCount, 'day', TruncDate, ['hardwareCode', 'softwareCode']),
+    Log: (LogHourlyCount, 'hour', TruncHour, ['hardwareCode']),
+}
+
+
+def bucket(trunc, created_at):
+    # Same buckets as TruncDate/TruncHour in the current time zone
+    local = timezone.localtime(created_at)
+    if trunc is TruncDate:
+        return local.date()
+    return local.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_key(model, instance):
+    rollup, bucket_field, trunc, fields = ROLLUPS[model]
+    key = {bucket_field: bucket(trunc, instance.created_at)}
+    key.update({field: getattr(instance, field) for field in fields})
+    return tuple(sorted(key.items()))
+
+
+def increment(rollup, counts):
+    """
+    Add counts, a Counter of rollup keys, to the rollup table: one UPDATE
+    per key, an INSERT when the row does not exist yet.
+    """
+    for key, amount in counts.items():
+        lookup = dict(key)
+        if rollup.objects.filter(**lookup).update(count=F('count') + amount):
+            continue
+        try:
+            with transaction.atomic():
+                rollup.objects.create(count=amount, **lookup)
+        except IntegrityError:
+            # Created concurrently since the UPDATE
+            rollup.objects.filter(**lookup).update(count=F('count') + amount)
+
+
+def record_created(model, instances):
+    """
+    Count newly created Bug or Log rows into their rollup. Called from
+    post_save, and directly after bulk_create, which sends no signals.
+    """
+    rollup = ROLLUPS[model][0]
+    increment(rollup, Counter(rollup_key(model, instance) for instance in instances))
+
+
+def backfill(model, since=None):
+    """
+    Recompute model's rollup from its rows, from the start of the bucket
+    containing since (the oldest row when None). Rollup rows before that
+    are kept, they may describe rows already archived or removed by
+    retention. Returns the number of rollup rows written.
+    """
+    rollup, bucket_field, trunc, fields = ROLLUPS[model]
+    if since is None:
+        since = model.objects.order_by('created_at').values_list('created_at', flat=True).first()
+        if since is None:
+            return 0
+    start = bucket(trunc, since)
+    if trunc is TruncDate:
+        rows = model.objects.filter(created_at__date__gte=start)
+    else:
+        rows = model.objects.filter(created_at__gte=start)
+    buckets = rollup.objects.filter(**{f"{bucket_field}__gte": start})
+
+    grouped = (
+        rows.annotate(**{bucket_field: trunc('created_at')})
+        .values(bucket_field, *fields)
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    with transaction.atomic():
+        buckets.delete()
+        created = rollup.objects.bulk_create(
+            (rollup(count=row.pop('total'), **row) for row in grouped.iterator()),
+            batch_size=500,
+        )
+    return len(created)
+
+
+def rollup_series(model, start, end, filters=None, group_by=None):
+    """
+    Read counts for model from its rollup between start and end (inclusive
+    buckets), optionally filtered on and grouped by code fields. Returns
+    dicts of bucket, code fields and count, ordered by bucket.
+    """
+    rollup, bucket_field, trunc, fields = ROLLUPS[model]
+    if trunc is TruncHour:
+        start = bucket(trunc, start)
+    rows = rollup.objects.filter(**{f"{bucket_field}__gte": start, f"{bucket_field}__lte": end})
+    for field, value in (filters or {}).items():
+        rows = rows.filter(**{field: value})
+    keys = [bucket_field] + [field for field in fields if not group_by or field in group_by]
+    return list(rows.values(*keys).annotate(count=Sum('count')).order_by(*keys))
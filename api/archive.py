@@ -0,0 +1,224 @@
+import gzip
+import json
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import ArchiveSegment, Bug, Log
+
+# Models archive_old_rows may move out of the database, by --model name
+ARCHIVED_MODELS = {
+    'log': Log,
+    'bug': Bug,
+}
+
+ARCHIVE_BATCH_SIZE = 10000
+
+
+def archive_dir():
+    return str(settings.ARCHIVE_DIR)
+
+
+def archive_path(model, month):
+    # Relative to ARCHIVE_DIR, one file per model and month
+    return os.path.join(model._meta.model_name, f"{month}.jsonl.gz")
+
+
+def serialize_row(obj):
+    # None is left out, value_to_string() would turn it into 'None'
+    return {
+        field.attname: field.value_to_string(obj)
+        for field in obj._meta.concrete_fields
+        if field.value_from_object(obj) is not None
+    }
+
+
+def deserialize_row(model, data):
+    values = {}
+    for field in model._meta.concrete_fields:
+        if field.attname in data:
+            values[field.attname] = field.to_python(data[field.attname])
+    return model(**values)
+
+
+def write_segment(model, month, rows):
+    """
+    Append rows (all created in month) as one gzip member to the month's
+    archive file and return the unsaved ArchiveSegment describing it.
+    """
+    relative = archive_path(model, month)
+    path = os.path.join(archive_dir(), relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    payload = ''.join(json.dumps(serialize_row(row), separators=(',', ':')) + '\n' for row in rows)
+    member = gzip.compress(payload.encode(), compresslevel=6)
+    with open(path, 'ab') as archive:
+        offset = os.fstat(archive.fileno()).st_size
+        archive.write(member)
+        archive.flush()
+        os.fsync(archive.fileno())
+
+    return ArchiveSegment(
+        model_label=model._meta.label_lower,
+        month=month,
+        path=relative,
+        offset=offset,
+        length=len(member),
+        row_count=len(rows),
+        min_id=min(row.pk for row in rows),
+        max_id=max(row.pk for row in rows),
+        min_created=min(row.created_at for row in rows),
+        max_created=max(row.created_at for row in rows),
+    )
+
+
+def read_segment(segment, model):
+    """
+    Return the rows of one segment as unsaved model instances, by id.
+    """
+    with open(os.path.join(archive_dir(), segment.path), 'rb') as archive:
+        archive.seek(segment.offset)
+        member = archive.read(segment.length)
+    rows = [deserialize_row(model, json.loads(line)) for line in gzip.decompress(member).splitlines() if line]
+    rows.sort(key=lambda row: row.pk)
+    return rows
+
+
+def archive_older_than(model, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """
+    Move rows of model created before cutoff into the archive, a batch at a
+    time. Files are written and synced before the rows are deleted, so an
+    interruption can at worst leave an unindexed member in a file.
+    Returns the number of rows archived.
+    """
+    archived = 0
+    while True:
+        rows = list(model.objects.filter(created_at__lt=cutoff).order_by('pk')[:batch_size])
+        if not rows:
+            return archived
+
+        by_month = defaultdict(list)
+        for row in rows:
+            by_month[timezone.localtime(row.created_at).strftime('%Y-%m')].append(row)
+        segments = [write_segment(model, month, month_rows) for month, month_rows in sorted(by_month.items())]
+
+        with transaction.atomic():
+            ArchiveSegment.objects.bulk_create(segments)
+            model.objects.filter(pk__in=[row.pk for row in rows]).delete()
+        archived += len(rows)
+
+
+def segments_for(model):
+    return ArchiveSegment.objects.filter(model_label=model._meta.label_lower)
+
+
+def get_archived(model, pk):
+    """
+    Look up one archived row by primary key, None when it is not archived.
+    """
+    for segment in segments_for(model).filter(min_id__lte=pk, max_id__gte=pk).order_by('min_id'):
+        for row in read_segment(segment, model):
+            if row.pk == pk:
+                return row
+    return None
+
+
+def archive_reaches(model, start=None, end=None):
+    """
+    Whether rows created between start and end (either may be None for an
+    open range) may be in the archive.
+    """
+    segments = segments_for(model)
+    if start is not None:
+        segments = segments.filter(max_created__gte=start)
+    if end is not None:
+        segments = segments.filter(min_created__lte=end)
+    return segments.exists()
+
+
+class TieredRows:
+    """
+    Archived rows of model created between start and end, followed by the
+    rows of queryset, as one sliceable sequence for the paginator. Archived
+    rows come first in id order; matches is an optional extra filter on them.
+
+    Segments entirely inside the range are counted from the index and only
+    decompressed when a page actually falls into them.
+    """
+
+    def __init__(self, queryset, start=None, end=None, matches=None):
+        # Pages are sliced from the queryset, which needs a stable order
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        self.queryset = queryset
+        self.model = queryset.model
+        self.start = start
+        self.end = end
+        self.matches = matches
+
+        segments = segments_for(self.model)
+        if start is not None:
+            segments = segments.filter(max_created__gte=start)
+        if end is not None:
+            segments = segments.filter(min_created__lte=end)
+        self.segments = list(segments.order_by('min_id'))
+        self._rows = {}
+        self._counts = None
+
+    def segment_rows(self, segment):
+        if segment.pk not in self._rows:
+            self._rows[segment.pk] = [
+                row for row in read_segment(segment, self.model)
+                if (self.start is None or row.created_at >= self.start)
+                and (self.end is None or row.created_at <= self.end)
+                and (self.matches is None or self.matches(row))
+            ]
+        return self._rows[segment.pk]
+
+    def segment_count(self, segment):
+        inside = ((self.start is None or segment.min_created >= self.start)
+                  and (self.end is None or segment.max_created <= self.end))
+        if inside and self.matches is None:
+            return segment.row_count
+        return len(self.segment_rows(segment))
+
+    @property
+    def archived_count(self):
+        if self._counts is None:
+            self._counts = [self.segment_count(segment) for segment in self.segments]
+        return sum(self._counts)
+
+    def count(self):
+        return self.archived_count + self.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def archived_slice(self, start, stop):
+        rows = []
+        position = 0
+        for segment, count in zip(self.segments, self._counts):
+            if position >= stop:
+                break
+            if position + count > start:
+                segment_rows = self.segment_rows(segment)
+                rows.extend(segment_rows[max(start - position, 0):stop - position])
+            position += count
+        return rows
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        archived = self.archived_count
+        stop = index.stop if index.stop is not None else archived + self.queryset.count()
+
+        rows = []
+        if start < archived:
+            rows.extend(self.archived_slice(start, min(stop, archived)))
+        if stop > archived:
+            rows.extend(self.queryset[max(start - archived, 0):stop - archived])
+        return rows
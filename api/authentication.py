@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+DEFAULT_AUTH_USER_CACHE_SIZE = 1024
+DEFAULT_AUTH_USER_CACHE_TTL = 60
+
+
+class UserCache:
+    """
+    Process-local LRU cache with a TTL. Stores the field values of a user and
+    their profile rather than the instances, so every request gets its own
+    fresh objects and never sees another request's modifications.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache(
+    getattr(settings, 'AUTH_USER_CACHE_SIZE', DEFAULT_AUTH_USER_CACHE_SIZE),
+    getattr(settings, 'AUTH_USER_CACHE_TTL', DEFAULT_AUTH_USER_CACHE_TTL),
+)
+
+
+def _field_values(instance):
+    return tuple(getattr(instance, field.attname) for field in instance._meta.concrete_fields)
+
+
+def _from_values(model, values):
+    return model.from_db(DEFAULT_DB_ALIAS, [field.attname for field in model._meta.concrete_fields], values)
+
+
+def invalidate_cached_user(user_id):
+    user_cache.delete(str(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps recently authenticated users (with their
+    profile) in a per-process LRU cache keyed by the user id claim, so a
+    cache hit authenticates without a query. Entries expire after
+    AUTH_USER_CACHE_TTL seconds and are dropped on post_save/post_delete of
+    the user or their profile; other processes see changes within the TTL.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        key = str(user_id)
+        cached = user_cache.get(key)
+        if cached is None:
+            user = self.load_user(user_id)
+            profile = user.profile if self.has_profile(user) else None
+            user_cache.set(key, (_field_values(user), _field_values(profile) if profile else None))
+        else:
+            user_values, profile_values = cached
+            user = _from_values(self.user_model, user_values)
+            if profile_values is not None:
+                user.profile = _from_values(self.user_model.profile.related.related_model, profile_values)
+
+        self.check_user(user, validated_token)
+        return user
+
+    def load_user(self, user_id):
+        queryset = self.user_model.objects.all()
+        if hasattr(self.user_model, 'profile'):
+            queryset = queryset.select_related('profile')
+        try:
+            return queryset.get(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found") from e
+
+    def has_profile(self, user):
+        try:
+            return hasattr(self.user_model, 'profile') and user.profile is not None
+        except self.user_model.profile.RelatedObjectDoesNotExist:
+            return False
+
+    def check_user(self, user, validated_token):
+        # The same checks JWTAuthentication.get_user makes after loading the user
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
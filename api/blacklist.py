@@ -0,0 +1,151 @@
+import hashlib
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+DEFAULT_SYNC_INTERVAL = 1
+DEFAULT_REBUILD_INTERVAL = 3600
+DEFAULT_SYNC_OVERLAP = 100
+BLOOM_ERROR_RATE = 0.01
+BLOOM_MIN_CAPACITY = 1024
+
+COMPACT_BATCH_SIZE = 5000
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter of strings. Membership tests may return false
+    positives (at about error_rate once capacity items are added) but never
+    false negatives.
+    """
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & 1 << (position & 7) for position in self._positions(item))
+
+
+class BlacklistFilter:
+    """
+    Process-local Bloom filter of the JTIs of blacklisted, unexpired tokens.
+    A JTI the filter does not contain is certainly not blacklisted, so only
+    the rare maybe needs the blacklist query.
+
+    Rows blacklisted by this process are added as they are written. Rows
+    written by other processes are picked up by a primary key range query at
+    most every sync_interval seconds, which bounds how long a token
+    blacklisted elsewhere stays usable here. Ids are allocated before the
+    inserting transaction commits, so a row can become visible after a
+    higher id was already seen; each sync re-reads the last sync_overlap
+    ids to pick those up. The filter is rebuilt from
+    scratch every rebuild_interval seconds to resize it and forget expired
+    and compacted tokens.
+    """
+
+    def __init__(self, sync_interval=DEFAULT_SYNC_INTERVAL, rebuild_interval=DEFAULT_REBUILD_INTERVAL,
+                 sync_overlap=DEFAULT_SYNC_OVERLAP):
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.sync_overlap = sync_overlap
+        self.bloom = None
+        self.last_id = 0
+        self.synced_at = 0
+        self.built_at = 0
+        self.lock = threading.Lock()
+
+    def rebuild(self):
+        blacklisted = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        last_id = BlacklistedToken.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        bloom = BloomFilter(max(blacklisted.count() * 2, BLOOM_MIN_CAPACITY))
+        for jti in blacklisted.filter(id__lte=last_id).values_list('token__jti', flat=True).iterator():
+            bloom.add(jti)
+        self.bloom = bloom
+        self.last_id = last_id
+        self.built_at = self.synced_at = time.monotonic()
+
+    def sync(self):
+        # Adding a JTI twice is harmless, so the overlap only costs the read
+        since = max(self.last_id - self.sync_overlap, 0)
+        new = BlacklistedToken.objects.filter(id__gt=since).values_list('id', 'token__jti')
+        for row_id, jti in new:
+            self.bloom.add(jti)
+            self.last_id = max(self.last_id, row_id)
+        self.synced_at = time.monotonic()
+
+    def refresh(self):
+        now = time.monotonic()
+        with self.lock:
+            if self.bloom is None or now - self.built_at >= self.rebuild_interval:
+                self.rebuild()
+            elif now - self.synced_at >= self.sync_interval:
+                self.sync()
+
+    def add(self, jti):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+
+    def might_contain(self, jti):
+        self.refresh()
+        return jti in self.bloom
+
+    def reset(self):
+        with self.lock:
+            self.bloom = None
+
+
+blacklist_filter = BlacklistFilter(
+    getattr(settings, 'TOKEN_BLACKLIST_SYNC_INTERVAL', DEFAULT_SYNC_INTERVAL),
+    getattr(settings, 'TOKEN_BLACKLIST_REBUILD_INTERVAL', DEFAULT_REBUILD_INTERVAL),
+    getattr(settings, 'TOKEN_BLACKLIST_SYNC_OVERLAP', DEFAULT_SYNC_OVERLAP),
+)
+
+
+class FilteredRefreshToken(RefreshToken):
+    """
+    RefreshToken whose blacklist check consults blacklist_filter first and
+    only queries the blacklist when the filter reports a possible match.
+    """
+
+    def check_blacklist(self):
+        if blacklist_filter.might_contain(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+
+def compact_expired_tokens(batch_size=COMPACT_BATCH_SIZE, now=None):
+    """
+    Delete outstanding tokens that have expired, with their blacklist rows,
+    a batch at a time so neither table stays locked for long. Expired tokens
+    fail verification on their own, they no longer need to be tracked.
+    Returns the numbers of outstanding and blacklisted rows deleted.
+    """
+    now = now or timezone.now()
+    expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('id')
+    outstanding = blacklisted = 0
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return outstanding, blacklisted
+        blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+        outstanding += OutstandingToken.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,125 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+COUNT_CACHE_PREFIX = 'count'
+
+
+def count_cache_ttl():
+    return getattr(settings, 'COUNT_CACHE_TTL', 30)
+
+
+def count_estimate_threshold():
+    return getattr(settings, 'COUNT_ESTIMATE_THRESHOLD', 100000)
+
+
+def _version_key(model):
+    return f"{COUNT_CACHE_PREFIX}:{model._meta.label_lower}:version"
+
+
+def count_version(model):
+    return cache.get_or_set(_version_key(model), 1, None)
+
+
+def invalidate_counts(model):
+    """
+    Drop every cached count of model's table by moving it to a new version;
+    the old entries are never read again and expire on their TTL.
+    """
+    try:
+        cache.incr(_version_key(model))
+    except ValueError:
+        cache.set(_version_key(model), 1, None)
+
+
+def invalidate_counts_on_change(sender, **kwargs):
+    invalidate_counts(sender)
+
+
+def count_cache_key(queryset):
+    model = queryset.model
+    # Ordering does not change the count
+    query = queryset.order_by().query
+    try:
+        sql, params = query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return None
+    digest = hashlib.sha1(f"{sql}|{params!r}".encode()).hexdigest()
+    return f"{COUNT_CACHE_PREFIX}:{model._meta.label_lower}:{count_version(model)}:{digest}"
+
+
+def is_unfiltered(queryset):
+    query = queryset.query
+    return not query.where and not query.extra_tables and not query.distinct and query.group_by is None
+
+
+def estimate_count(queryset):
+    """
+    Return the database's row estimate for the whole table, None when it
+    has none. Only meaningful for unfiltered querysets.
+    """
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            # -1 until the table was first vacuumed or analyzed
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            # Ids are assigned in increasing order and rows are rarely deleted,
+            # so the id span is close to the row count; both ends are index lookups.
+            pk = queryset.model._meta.pk
+            if not pk.get_internal_type().endswith('AutoField'):
+                return None
+            cursor.execute(f'SELECT MAX("{pk.column}") - MIN("{pk.column}") + 1 FROM "{table}"')
+            row = cursor.fetchone()
+            return row[0] if row and row[0] is not None else 0
+    return None
+
+
+def get_count(queryset):
+    """
+    Return (count, approximate) for queryset. Counts are cached per model and
+    query for COUNT_CACHE_TTL seconds and invalidated on post_save/post_delete;
+    unfiltered tables larger than COUNT_ESTIMATE_THRESHOLD rows return the
+    database's estimate instead of counting.
+    """
+    key = count_cache_key(queryset)
+    if key is None:
+        return queryset.count(), False
+
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    result = None
+    if is_unfiltered(queryset):
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate >= count_estimate_threshold():
+            result = (estimate, True)
+    if result is None:
+        result = (queryset.count(), False)
+
+    cache.set(key, result, count_cache_ttl())
+    return result
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Paginator taking its count from get_count, see there.
+    """
+
+    approximate = False
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+        count, self.approximate = get_count(self.object_list)
+        return count
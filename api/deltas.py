@@ -0,0 +1,144 @@
+import hashlib
+import os
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+
+import bsdiff4
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError
+
+from api.jobs import discard_process_pool, get_process_pool, run_job, update_job
+from api.models import AppVersion, AppVersionDelta, Blob, release_stored_files
+from api.storage import blob_key
+
+POOL_NAME = 'app-version-deltas'
+
+DEFAULT_DELTA_SOURCES = 3
+DEFAULT_DELTA_WORKERS = 1
+# bsdiff needs about 16 times the file size in memory
+DEFAULT_DELTA_MAX_FILE_SIZE = 64 * 1024 * 1024
+# A patch this large relative to the new file saves too little to be worth it
+DEFAULT_DELTA_MAX_RATIO = 0.8
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _sha256_path(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def file_sha256(field_file):
+    """
+    SHA-256 of a stored file: from the Blob table for content-addressed
+    names, hashed from disk for files stored before it.
+    """
+    key = blob_key(field_file.name)
+    if key:
+        digest = Blob.objects.filter(key=key).values_list('digest', flat=True).first()
+        if digest:
+            return digest
+    return _sha256_path(field_file.path)
+
+
+def delta_sources(version):
+    # The versions devices are most likely to update from
+    count = getattr(settings, 'APP_VERSION_DELTA_SOURCES', DEFAULT_DELTA_SOURCES)
+    return list(AppVersion.objects.filter(created_at__lt=version.created_at).order_by('-created_at')[:count])
+
+
+def build_delta(source, target, field):
+    """
+    Diff one file of source against the same file of target and store the
+    patch. Returns the AppVersionDelta, None when either file is missing or
+    too large, the files are identical or the patch would not be smaller
+    than APP_VERSION_DELTA_MAX_RATIO of the new file.
+    """
+    source_file = getattr(source, field)
+    target_file = getattr(target, field)
+    if not source_file or not target_file:
+        return None
+    max_size = getattr(settings, 'APP_VERSION_DELTA_MAX_FILE_SIZE', DEFAULT_DELTA_MAX_FILE_SIZE)
+    if source_file.size > max_size or target_file.size > max_size:
+        return None
+
+    source_sha256 = file_sha256(source_file)
+    target_sha256 = file_sha256(target_file)
+    if source_sha256 == target_sha256:
+        return None
+
+    fd, patch_path = tempfile.mkstemp(suffix='.bsdiff')
+    os.close(fd)
+    try:
+        diff_in_pool(source_file.path, target_file.path, patch_path)
+        patch_size = os.path.getsize(patch_path)
+        ratio = getattr(settings, 'APP_VERSION_DELTA_MAX_RATIO', DEFAULT_DELTA_MAX_RATIO)
+        if patch_size > target_file.size * ratio:
+            return None
+
+        delta = AppVersionDelta(
+            from_version=source,
+            to_version=target,
+            field=field,
+            patch_size=patch_size,
+            patch_sha256=_sha256_path(patch_path),
+            source_sha256=source_sha256,
+            target_sha256=target_sha256,
+            target_size=target_file.size,
+        )
+        with open(patch_path, 'rb') as patch:
+            delta.patch.save(f"{source.id}-{target.id}-{field}.bsdiff", File(patch), save=False)
+    finally:
+        os.remove(patch_path)
+
+    try:
+        delta.save()
+    except IntegrityError:
+        # Built concurrently by another job, drop the reference to our copy
+        release_stored_files(AppVersionDelta, delta)
+        return AppVersionDelta.objects.get(from_version=source, to_version=target, field=field)
+    return delta
+
+
+def diff_in_pool(source_path, target_path, patch_path):
+    """
+    Run bsdiff in the delta process pool, so its memory is not taken from
+    the web process the job thread runs in.
+    """
+    workers = getattr(settings, 'APP_VERSION_DELTA_WORKERS', DEFAULT_DELTA_WORKERS)
+    try:
+        get_process_pool(POOL_NAME, workers).submit(bsdiff4.file_diff, source_path, target_path, patch_path).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); later jobs get a new pool
+        discard_process_pool(POOL_NAME)
+        raise
+
+
+def build_deltas_job(job, version_id):
+    """
+    Background job started after an upload: build the patches from the
+    previous APP_VERSION_DELTA_SOURCES versions to the new one.
+    """
+    version = AppVersion.objects.get(id=version_id)
+    sources = delta_sources(version)
+    existing = set(
+        AppVersionDelta.objects.filter(to_version=version).values_list('from_version_id', 'field')
+    )
+    tasks = [
+        (source, field) for source in sources for field in AppVersionDelta.FILE_FIELDS
+        if (source.id, field) not in existing
+    ]
+    built = 0
+    for done, (source, field) in enumerate(tasks, 1):
+        if build_delta(source, version, field):
+            built += 1
+        update_job(job, progress=int(done * 100 / (len(tasks) + 1)))
+    return f"Built {built} deltas to version {version.version_number} from {len(sources)} earlier versions."
+
+
+def schedule_delta_build(version):
+    return run_job(f"app-version-deltas:{version.id}", build_deltas_job, version.id)
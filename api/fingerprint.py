@@ -0,0 +1,163 @@
+import hashlib
+import re
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+# Parts of a crash report that differ between devices for the same crash
+NORMALIZE_PATTERNS = [
+    (re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'), ' <uuid> '),
+    (re.compile(r'0x[0-9a-f]+'), ' <hex> '),
+    (re.compile(r'\b(?=[0-9a-f]*[a-f])[0-9a-f]{12,}\b'), ' <hex> '),
+    (re.compile(r'\d+'), ' <num> '),
+]
+TOKEN_RE = re.compile(r'<\w+>|\w+', re.UNICODE)
+
+SIMHASH_BITS = 64
+
+# Reports whose SimHash differ in at most this many bits belong to the same
+# cluster. Split into SIMHASH_BANDS bands, two such signatures always agree
+# on at least one band, so candidates are found by exact band lookups.
+SIMHASH_MAX_DISTANCE = 3
+SIMHASH_BANDS = SIMHASH_MAX_DISTANCE + 1
+BAND_BITS = SIMHASH_BITS // SIMHASH_BANDS
+
+
+def normalize(text):
+    text = (text or '').lower()
+    for pattern, replacement in NORMALIZE_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return ' '.join(TOKEN_RE.findall(text))
+
+
+def exact_fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=SIMHASH_BITS // 8).digest(), 'big')
+
+
+def simhash(normalized):
+    # Token features: crash reports are short, and with shingles a single
+    # changed word moves too many bits for the distance threshold
+    features = Counter(normalized.split())
+
+    weights = [0] * SIMHASH_BITS
+    for feature, count in features.items():
+        value = _feature_hash(feature)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += count if value >> bit & 1 else -count
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def bands(signature):
+    mask = (1 << BAND_BITS) - 1
+    return [signature >> (band * BAND_BITS) & mask for band in range(SIMHASH_BANDS)]
+
+
+def to_signed(value):
+    # Stored in a signed 64-bit BigIntegerField
+    return value - (1 << SIMHASH_BITS) if value >= 1 << (SIMHASH_BITS - 1) else value
+
+
+def to_unsigned(value):
+    return value + (1 << SIMHASH_BITS) if value < 0 else value
+
+
+def fingerprint_bug(bug):
+    """
+    Set bug.fingerprint and bug.simhash from its text.
+    """
+    normalized = normalize(bug.bugTxt)
+    bug.fingerprint = exact_fingerprint(normalized)
+    bug.simhash = to_signed(simhash(normalized))
+
+
+def find_cluster(bug):
+    """
+    Return the id of the cluster an identical or near-identical report
+    already belongs to, None for a new kind of report.
+    """
+    from api.models import Bug, BugCluster
+
+    cluster_id = (
+        Bug.objects.filter(fingerprint=bug.fingerprint, cluster__isnull=False)
+        .values_list('cluster_id', flat=True).first()
+    )
+    if cluster_id:
+        return cluster_id
+
+    signature = to_unsigned(bug.simhash)
+    condition = Q()
+    for index, value in enumerate(bands(signature)):
+        condition |= Q(**{f"band{index}": value})
+    best = None
+    for candidate_id, candidate in BugCluster.objects.filter(condition).values_list('id', 'simhash'):
+        distance = hamming(signature, to_unsigned(candidate))
+        if distance <= SIMHASH_MAX_DISTANCE and (best is None or distance < best[0]):
+            best = (distance, candidate_id)
+    return best[1] if best else None
+
+
+def assign_cluster(bug):
+    """
+    Fingerprint bug if needed and point it at its cluster, creating the
+    cluster for a new kind of report. Does not save bug.
+    """
+    from api.models import BugCluster
+
+    if not bug.fingerprint or bug.simhash is None:
+        fingerprint_bug(bug)
+    cluster_id = find_cluster(bug)
+    if cluster_id is None:
+        signature = to_unsigned(bug.simhash)
+        cluster = BugCluster.objects.create(
+            simhash=bug.simhash,
+            first_seen=bug.created_at or timezone.now(),
+            last_seen=bug.created_at or timezone.now(),
+            sample_text=bug.bugTxt[:1000],
+            **{f"band{index}": value for index, value in enumerate(bands(signature))},
+        )
+        cluster_id = cluster.id
+    bug.cluster_id = cluster_id
+
+
+def count_in_cluster(bug):
+    from api.models import BugCluster
+
+    BugCluster.objects.filter(pk=bug.cluster_id).update(
+        bug_count=F('bug_count') + 1,
+        last_seen=Greatest('last_seen', Value(bug.created_at)),
+        # Greatest() is NULL on SQLite when any argument is
+        last_bug_id=Greatest(Coalesce('last_bug_id', Value(0)), Value(bug.pk)),
+    )
+
+
+def cluster_new_bug(bug):
+    """
+    Assign a just inserted bug to its cluster and count it. Runs after the
+    INSERT and inside the caller's transaction, so a failed insert or a
+    rolled back batch leaves no cluster behind.
+    """
+    from api.models import Bug
+
+    with transaction.atomic():
+        if bug.cluster_id is None:
+            assign_cluster(bug)
+            Bug.objects.filter(pk=bug.pk).update(cluster_id=bug.cluster_id)
+        count_in_cluster(bug)
+
+
+def uncount_in_cluster(bug):
+    # first_seen, last_seen and last_bug_id describe the history and stay
+    from api.models import BugCluster
+
+    BugCluster.objects.filter(pk=bug.cluster_id).update(bug_count=Greatest(F('bug_count') - 1, Value(0)))
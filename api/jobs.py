@@ -0,0 +1,86 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from api.models import JobRec
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKGROUND_JOB_WORKERS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+_process_pools = {}
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'BACKGROUND_JOB_WORKERS', DEFAULT_BACKGROUND_JOB_WORKERS),
+                thread_name_prefix='api-jobs',
+            )
+        return _executor
+
+
+def get_process_pool(name, max_workers):
+    """
+    Process pool for CPU-bound work, one per name, started on first use.
+    Workers are spawned rather than forked so starting them from a threaded
+    server is safe, and set Django up once. Functions sent to them must
+    live in modules that can be imported after django.setup().
+    """
+    with _executor_lock:
+        if name not in _process_pools:
+            _process_pools[name] = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+        return _process_pools[name]
+
+
+def discard_process_pool(name):
+    # After a worker died (BrokenProcessPool) the pool accepts no more work
+    with _executor_lock:
+        pool = _process_pools.pop(name, None)
+    if pool is not None:
+        pool.shutdown(wait=False)
+
+
+def update_job(job, **fields):
+    for name, value in fields.items():
+        setattr(job, name, value)
+    job.date = timezone.now()
+    job.save(update_fields=list(fields) + ['date'])
+
+
+def _run_job(job, func, args):
+    try:
+        update_job(job, status=JobRec.RUNNING)
+        detail = func(job, *args)
+        update_job(job, status=JobRec.DONE, progress=100, detail=detail or '')
+    except Exception as e:
+        logger.exception(f"Job {job.job_name} failed")
+        update_job(job, status=JobRec.FAILED, detail=str(e))
+    finally:
+        # Worker threads own their connection, don't leave it open between jobs
+        connection.close()
+
+
+def run_job(job_name, func, *args):
+    """
+    Record a queued JobRec and run func(job, *args) on the worker pool.
+    func may report progress with update_job() and returns an optional detail
+    message stored on the finished job. Returns the JobRec immediately.
+    """
+    job = JobRec.objects.create(status=JobRec.QUEUED, job_name=job_name, date=timezone.now())
+    get_executor().submit(_run_job, job, func, args)
+    return job
@@ -0,0 +1,27 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.archive import ARCHIVE_BATCH_SIZE, ARCHIVED_MODELS, archive_older_than
+
+
+class Command(BaseCommand):
+    help = "Move logs and bugs older than the retention period into the compressed monthly archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_RETENTION_DAYS,
+                            help="Archive rows created more than this many days ago.")
+        parser.add_argument('--model', choices=sorted(ARCHIVED_MODELS),
+                            help="Only archive this model (default: all).")
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        for name, model in sorted(ARCHIVED_MODELS.items()):
+            if options['model'] and name != options['model']:
+                continue
+            count = archive_older_than(model, cutoff, options['batch_size'])
+            self.stdout.write(f"{model.__name__}: archived {count} rows created before {cutoff:%Y-%m-%d}.")
+        self.stdout.write(self.style.SUCCESS("Archiving complete."))
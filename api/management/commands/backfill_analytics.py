@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from api.analytics import ROLLUPS, backfill
+
+
+class Command(BaseCommand):
+    help = "Rebuild the bug and log rollup tables from the Bug and Log rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Only rebuild buckets from this date (YYYY-MM-DD) on, by default from the oldest row.")
+        parser.add_argument('--model', choices=['bug', 'log'], help="Only rebuild this model's rollup.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            day = parse_date(options['since'])
+            if day is None:
+                raise CommandError("--since must be a date (YYYY-MM-DD).")
+            since = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+        for model in ROLLUPS:
+            if options['model'] and model._meta.model_name != options['model']:
+                continue
+            written = backfill(model, since)
+            self.stdout.write(f"{model.__name__}: wrote {written} rollup rows.")
+        self.stdout.write(self.style.SUCCESS("Backfill complete."))
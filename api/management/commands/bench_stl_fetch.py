@@ -0,0 +1,73 @@
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Examination
+from api.stl import extract_members, open_examination_zip, select_filenames
+
+
+def legacy_extract(examination, filenames, target_dir):
+    # Old fetch-stl path: the whole ZIP body is held in memory (what
+    # requests' response.content used to be) and each member is read fully
+    with open_examination_zip(examination) as archive:
+        zip_content = archive.read()
+
+    extracted = []
+    with zipfile.ZipFile(io.BytesIO(zip_content)) as z:
+        for stl_filename in filenames:
+            if stl_filename in z.namelist():
+                stl_content = z.read(stl_filename)
+                with open(os.path.join(target_dir, stl_filename), 'wb') as stl_file:
+                    stl_file.write(stl_content)
+                extracted.append(stl_filename)
+    return extracted
+
+
+def streaming_extract(examination, filenames, target_dir):
+    with open_examination_zip(examination) as archive:
+        return extract_members(archive, filenames, target_dir)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare peak Python memory and latency of the legacy in-memory STL "
+        "extraction with the streaming storage-backed one. The legacy numbers "
+        "exclude the extra HTTP round trip the old view made to itself."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('examination_id', type=int)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--filenames', nargs='*', default=None)
+
+    def handle(self, *args, **options):
+        try:
+            examination = Examination.objects.get(id=options['examination_id'])
+        except Examination.DoesNotExist:
+            raise CommandError("Examination not found.")
+
+        filenames = select_filenames(options['filenames'])
+        self.stdout.write(f"Archive: {examination.download.name} ({examination.download.size} bytes)")
+
+        for label, extract in (('legacy', legacy_extract), ('streaming', streaming_extract)):
+            timings = []
+            peaks = []
+            for _ in range(options['repeat']):
+                with tempfile.TemporaryDirectory() as target_dir:
+                    tracemalloc.start()
+                    started = time.perf_counter()
+                    extracted = extract(examination, filenames, target_dir)
+                    timings.append(time.perf_counter() - started)
+                    peaks.append(tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+
+            self.stdout.write(
+                f"{label:>9}: {len(extracted)} files, "
+                f"best {min(timings) * 1000:.1f} ms, "
+                f"peak {max(peaks) / (1024 * 1024):.1f} MiB"
+            )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.fingerprint import assign_cluster, count_in_cluster
+from api.models import Bug
+
+
+class Command(BaseCommand):
+    help = "Fingerprint and cluster bugs that have no cluster yet (e.g. reported before clustering existed)."
+
+    def handle(self, *args, **options):
+        clustered = 0
+        for bug in Bug.objects.filter(cluster__isnull=True).order_by('pk').iterator():
+            assign_cluster(bug)
+            bug.save(update_fields=['fingerprint', 'simhash', 'cluster'])
+            count_in_cluster(bug)
+            clustered += 1
+        self.stdout.write(self.style.SUCCESS(f"Clustered {clustered} bugs."))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.blacklist import COMPACT_BATCH_SIZE, compact_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete expired outstanding tokens and their blacklist entries in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=COMPACT_BATCH_SIZE,
+                            help="Tokens deleted per batch.")
+
+    def handle(self, *args, **options):
+        outstanding, blacklisted = compact_expired_tokens(options['batch_size'])
+        self.stdout.write(f"Deleted {outstanding} expired outstanding tokens and {blacklisted} blacklist entries.")
+        self.stdout.write(self.style.SUCCESS("Compaction complete."))
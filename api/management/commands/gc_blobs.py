@@ -0,0 +1,104 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from api.models import Blob
+from api.storage import BLOB_DIR, ContentAddressedStorage, blob_key
+
+
+def count_references():
+    """
+    Count, over every FileField backed by a content-addressed storage,
+    how many rows point at each blob.
+    """
+    counts = Counter()
+    for model in apps.get_models():
+        for field in model._meta.fields:
+            if not isinstance(field, models.FileField) or not isinstance(field.storage, ContentAddressedStorage):
+                continue
+            names = model._default_manager.exclude(**{field.attname: ''}).values_list(field.attname, flat=True)
+            for name in names.iterator():
+                key = blob_key(name or '')
+                if key:
+                    counts[key] += 1
+    return counts
+
+
+class Command(BaseCommand):
+    help = "Recount blob references across all models and delete unreferenced blobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help="Keep unreferenced blobs younger than this, their row may not be saved yet.")
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        cutoff = timezone.now() - timedelta(minutes=options['grace_minutes'])
+        # Stored counts are read before the references are, so a reference
+        # added in between is counted at most once too often, never missed
+        stored = dict(Blob.objects.values_list('key', 'ref_count'))
+        counts = count_references()
+
+        corrected = 0
+        for key, ref_count in stored.items():
+            difference = counts.get(key, 0) - ref_count
+            if not difference:
+                continue
+            corrected += 1
+            if not options['dry_run']:
+                # Relative, so retain()/release() calls since the snapshot are kept
+                Blob.objects.filter(key=key).update(
+                    ref_count=Greatest(F('ref_count') + difference, Value(0)),
+                )
+        self.stdout.write(f"Corrected {corrected} reference counts.")
+
+        # Only blobs that were already at 0 before this run; one corrected
+        # down to 0 just now is deleted by the next run if still unreferenced
+        freed = 0
+        deleted = 0
+        for blob in Blob.objects.filter(created_at__lt=cutoff, ref_count=0).iterator():
+            if stored.get(blob.key) != 0 or counts.get(blob.key):
+                continue
+            if options['dry_run']:
+                freed += blob.size
+                deleted += 1
+                continue
+            with transaction.atomic():
+                # Skipped when an upload took a reference since
+                if Blob.objects.filter(pk=blob.pk, ref_count=0).delete()[0]:
+                    storage.delete_blob(blob.key)
+                    freed += blob.size
+                    deleted += 1
+
+        # Blob directories on disk without a row (e.g. a crash between write and insert)
+        known = set(Blob.objects.values_list('key', flat=True))
+        orphans = 0
+        if storage.exists(BLOB_DIR):
+            for prefix in storage.listdir(BLOB_DIR)[0]:
+                for rest in storage.listdir(f"{BLOB_DIR}/{prefix}")[0]:
+                    key = prefix + rest
+                    if key in known or counts.get(key):
+                        continue
+                    if storage.get_modified_time(f"{BLOB_DIR}/{prefix}/{rest}") >= cutoff:
+                        continue
+                    if options['dry_run']:
+                        orphans += 1
+                        continue
+                    with transaction.atomic():
+                        # An upload of the same content creates the row before using the directory
+                        if not Blob.objects.filter(key=key).exists():
+                            storage.delete_blob(key)
+                            orphans += 1
+
+        verb = "Would delete" if options['dry_run'] else "Deleted"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {deleted} unreferenced blobs ({freed / (1024 * 1024):.1f} MiB) and {orphans} orphaned directories."
+        ))
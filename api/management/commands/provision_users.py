@@ -0,0 +1,54 @@
+import csv
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from api.provisioning import provision_users
+
+
+def read_records(path, file_format):
+    with open(path, encoding='utf-8', newline='') as source:
+        if file_format == 'csv':
+            return [{key: value for key, value in row.items() if key and value} for row in csv.DictReader(source)]
+        if file_format == 'ndjson':
+            return [json.loads(line) for line in source if line.strip()]
+        records = json.load(source)
+        return records.get('users') if isinstance(records, dict) else records
+
+
+class Command(BaseCommand):
+    help = "Create users (devices) with their profiles in bulk from a CSV, JSON or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File with one user per row: email, username and optionally "
+                                         "serial_number, phone_number, password, full_name, bio.")
+        parser.add_argument('--format', choices=['csv', 'json', 'ndjson'],
+                            help="File format (default: from the file extension).")
+        parser.add_argument('--dry-run', action='store_true', help="Only validate the file.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in ('csv', 'json', 'ndjson'):
+            raise CommandError("Cannot tell the file format, pass --format.")
+        try:
+            records = read_records(path, file_format)
+        except (OSError, ValueError, csv.Error) as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+        if not isinstance(records, list):
+            raise CommandError("Expected a list of users.")
+
+        try:
+            created, errors = provision_users(records, dry_run=options['dry_run'])
+        except IntegrityError as e:
+            raise CommandError(f"Users were created concurrently, nothing was imported: {e}")
+
+        for error in errors:
+            self.stderr.write(f"Row {error['index']}: {json.dumps(error['errors'])}")
+        if options['dry_run']:
+            self.stdout.write(f"{len(records) - len(errors)} of {len(records)} users are valid.")
+        else:
+            self.stdout.write(f"Created {len(created)} users, skipped {len(errors)}.")
+        self.stdout.write(self.style.SUCCESS("Provisioning complete."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.uploads import purge_expired_sessions
+
+
+class Command(BaseCommand):
+    help = "Delete resumable upload sessions that have not been touched within CHUNKED_UPLOAD_EXPIRY."
+
+    def handle(self, *args, **options):
+        count = purge_expired_sessions()
+        self.stdout.write(self.style.SUCCESS(f"Purged {count} upload sessions."))
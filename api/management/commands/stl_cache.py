@@ -0,0 +1,62 @@
+import os
+import shutil
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.models import STLCacheEntry
+from api.stl import STL_DIR, evict_stl_cache, stl_cache_max_bytes, stl_cache_size
+
+
+def format_size(size_bytes):
+    return f"{size_bytes / (1024 * 1024):.1f} MiB"
+
+
+class Command(BaseCommand):
+    help = "Inspect, evict or purge the extracted STL cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--examination', type=int, help="Only act on this examination's entries.")
+        parser.add_argument('--evict', action='store_true', help="Apply the LRU size limit now.")
+        parser.add_argument('--max-bytes', type=int, help="Size limit for --evict (defaults to STL_CACHE_MAX_BYTES).")
+        parser.add_argument('--purge', action='store_true', help="Delete the selected entries and their files.")
+
+    def handle(self, *args, **options):
+        entries = STLCacheEntry.objects.order_by('-last_accessed')
+        if options['examination']:
+            entries = entries.filter(examination_id=options['examination'])
+
+        if options['purge']:
+            count = 0
+            for entry in entries:
+                entry.delete()
+                count += 1
+            if not options['examination']:
+                self.remove_orphans()
+            self.stdout.write(self.style.SUCCESS(f"Purged {count} cache entries."))
+            return
+
+        if options['evict']:
+            max_bytes = options['max_bytes'] if options['max_bytes'] is not None else stl_cache_max_bytes()
+            evicted = evict_stl_cache(max_bytes)
+            self.stdout.write(self.style.SUCCESS(f"Evicted {evicted} cache entries."))
+            return
+
+        for entry in entries:
+            self.stdout.write(
+                f"{entry.key}  {format_size(entry.size_bytes):>10}  "
+                f"{len(entry.filenames)} files  last used {entry.last_accessed:%Y-%m-%d %H:%M}"
+            )
+        self.stdout.write(f"Total: {format_size(stl_cache_size())} of {format_size(stl_cache_max_bytes())}")
+
+    def remove_orphans(self):
+        # Files left behind by the old flat layout or by interrupted extractions
+        stl_root = os.path.join(settings.MEDIA_ROOT, STL_DIR)
+        if not os.path.isdir(stl_root):
+            return
+        for name in os.listdir(stl_root):
+            path = os.path.join(stl_root, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
@@ -0,0 +1,164 @@
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+from api.mesh import QMESH_MEDIA_TYPE
+
+mimetypes.add_type('model/stl', '.stl')
+mimetypes.add_type('model/stl', '.STL')
+mimetypes.add_type(QMESH_MEDIA_TYPE, '.qmesh')
+
+# Sidecar suffix per content coding, in order of preference
+SIDECAR_ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def accepted_encodings(request):
+    accepted = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if params.strip().replace(' ', '') in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def select_representation(request, path):
+    """
+    Pick the precompressed sidecar the client accepts, falling back to the
+    file itself. Returns (path, content encoding or None).
+    """
+    accepted = accepted_encodings(request)
+    for encoding, suffix in SIDECAR_ENCODINGS:
+        if encoding in accepted and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return path, None
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single satisfiable byte range,
+    None when the header should be ignored (absent or multiple ranges)
+    and False when the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def iter_file_range(path, start, length):
+    with open(path, 'rb') as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def sendfile_response(relative_path):
+    # Hand the transfer (ranges included) over to the front-end server
+    mode = getattr(settings, 'MEDIA_SENDFILE', None)
+    response = HttpResponse()
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'MEDIA_SENDFILE_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative_path.replace(os.sep, '/')
+    else:
+        response['X-Sendfile'] = os.path.join(settings.MEDIA_ROOT, relative_path)
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    """
+    Serve a file from MEDIA_ROOT with byte ranges, ETag/Last-Modified
+    validation, precompressed .br/.gz sidecars and optional X-Accel-Redirect
+    or X-Sendfile offload (settings.MEDIA_SENDFILE).
+    """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404("Media file not found.")
+    if not os.path.isfile(full_path):
+        raise Http404("Media file not found.")
+
+    content_type, original_encoding = mimetypes.guess_type(full_path)
+    served_path, encoding = select_representation(request, full_path)
+
+    stat = os.stat(served_path)
+    last_modified = int(stat.st_mtime)
+    etag = quote_etag(f"{stat.st_size:x}-{stat.st_mtime_ns:x}" + (f"-{encoding}" if encoding else ''))
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if getattr(settings, 'MEDIA_SENDFILE', None):
+            response = sendfile_response(os.path.relpath(served_path, settings.MEDIA_ROOT))
+        else:
+            response = build_file_response(request, served_path, stat.st_size, etag, last_modified)
+        if response.status_code != 416:
+            response['Content-Type'] = content_type or 'application/octet-stream'
+            if encoding or original_encoding:
+                response['Content-Encoding'] = encoding or original_encoding
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Accept-Ranges'] = 'bytes'
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def build_file_response(request, path, size, etag, last_modified):
+    byte_range = None
+    if if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'))
+        response['Content-Length'] = str(size)
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(iter_file_range(path, start, length), status=206)
+    response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    response['Content-Length'] = str(length)
+    return response
@@ -0,0 +1,262 @@
+import mmap
+import os
+import re
+import struct
+
+import numpy as np
+
+
+BINARY_HEADER_SIZE = 84
+BINARY_DTYPE = np.dtype([
+    ('normal', '<f4', (3,)),
+    ('vertices', '<f4', (3, 3)),
+    ('attr', '<u2'),
+])
+
+# Triangles processed per step, bounds the size of float64 temporaries
+CHUNK_TRIANGLES = 1024 * 1024
+
+ASCII_VERTEX = re.compile(rb'vertex\s+(\S+)\s+(\S+)\s+(\S+)')
+
+
+def binary_triangle_count(path):
+    """
+    Return the triangle count if path is a binary STL, None otherwise.
+    A binary STL's size always matches the count stored in its header.
+    """
+    size = os.path.getsize(path)
+    if size < BINARY_HEADER_SIZE:
+        return None
+    with open(path, 'rb') as fh:
+        fh.seek(80)
+        triangles = int.from_bytes(fh.read(4), 'little')
+    if size != BINARY_HEADER_SIZE + triangles * BINARY_DTYPE.itemsize:
+        return None
+    return triangles
+
+
+def is_ascii_stl(path):
+    """
+    Cheap check for an ASCII STL: a 'solid' header followed by facet records.
+    Empty files and files shorter than a binary header are rejected.
+    """
+    if os.path.getsize(path) < BINARY_HEADER_SIZE:
+        return False
+    with open(path, 'rb') as fh:
+        head = fh.read(1024).lstrip()
+    return head.startswith(b'solid') and b'facet' in head
+
+
+def load_triangles(path):
+    """
+    Return the triangles of an STL file as an (n, 3, 3) float32 array.
+    Binary files are memory-mapped, so the mesh is paged in on demand and
+    never copied as a whole; ASCII files are parsed from a memory map.
+    Raises ValueError for anything else.
+    """
+    triangles = binary_triangle_count(path)
+    if triangles is not None:
+        if triangles == 0:
+            return np.empty((0, 3, 3), dtype=np.float32)
+        records = np.memmap(path, dtype=BINARY_DTYPE, mode='r', offset=BINARY_HEADER_SIZE, shape=(triangles,))
+        return records['vertices']
+    if not is_ascii_stl(path):
+        raise ValueError(f"{os.path.basename(path)} is not a valid STL file.")
+
+    with open(path, 'rb') as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        vertices = np.array(ASCII_VERTEX.findall(mm), dtype=np.float32)
+    return vertices.reshape(-1, 3, 3)
+
+
+def iter_chunks(triangles, size=CHUNK_TRIANGLES):
+    for start in range(0, len(triangles), size):
+        yield np.asarray(triangles[start:start + size], dtype=np.float64)
+
+
+def mesh_stats(path):
+    """
+    Compute triangle count, bounding box, enclosed volume and surface area.
+    Volume is the absolute sum of signed tetrahedron volumes, so it is only
+    meaningful for closed meshes.
+    """
+    triangles = load_triangles(path)
+    lower = np.full(3, np.inf)
+    upper = np.full(3, -np.inf)
+    volume = 0.0
+    area = 0.0
+
+    for chunk in iter_chunks(triangles):
+        v0, v1, v2 = chunk[:, 0], chunk[:, 1], chunk[:, 2]
+        lower = np.minimum(lower, chunk.min(axis=(0, 1)))
+        upper = np.maximum(upper, chunk.max(axis=(0, 1)))
+        volume += np.einsum('ij,ij->', v0, np.cross(v1, v2)) / 6.0
+        area += 0.5 * np.linalg.norm(np.cross(v1 - v0, v2 - v0), axis=1).sum()
+
+    if not len(triangles):
+        lower = upper = np.zeros(3)
+
+    return {
+        'triangle_count': len(triangles),
+        'min_x': float(lower[0]), 'min_y': float(lower[1]), 'min_z': float(lower[2]),
+        'max_x': float(upper[0]), 'max_y': float(upper[1]), 'max_z': float(upper[2]),
+        'volume': abs(float(volume)),
+        'surface_area': float(area),
+    }
+
+
+def face_normals(triangles):
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    return np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+
+
+def write_binary_stl(path, triangles, header=b'binary STL'):
+    records = np.zeros(len(triangles), dtype=BINARY_DTYPE)
+    records['vertices'] = triangles
+    records['normal'] = face_normals(np.asarray(triangles, dtype=np.float32))
+    with open(path, 'wb') as fh:
+        fh.write(header[:80].ljust(80, b'\0'))
+        fh.write(len(triangles).to_bytes(4, 'little'))
+        records.tofile(fh)
+
+
+def weld(triangles):
+    """
+    Merge bit-identical vertices. Returns (vertices, faces) where faces
+    indexes into vertices, turning the triangle soup into an indexed mesh.
+    """
+    flat = np.ascontiguousarray(triangles, dtype=np.float32).reshape(-1, 3)
+    keys = flat.view(np.dtype((np.void, flat.dtype.itemsize * 3))).reshape(-1)
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    return flat[first], inverse.reshape(-1, 3)
+
+
+def cluster_vertices(vertices, lower, cell_size):
+    """
+    Snap vertices to a uniform grid. Returns (representatives, inverse) where
+    representatives holds the mean position of every occupied cell and
+    inverse maps each input vertex to its cell.
+    """
+    cells = np.floor((vertices - lower) / cell_size).astype(np.int64)
+    span = cells.max(axis=0) + 1
+    keys = (cells[:, 0] * span[1] + cells[:, 1]) * span[2] + cells[:, 2]
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    representatives = np.empty((len(counts), 3))
+    for axis in range(3):
+        representatives[:, axis] = np.bincount(inverse, weights=vertices[:, axis], minlength=len(counts))
+    return representatives / counts[:, None], inverse
+
+
+def cluster_faces(faces, inverse, cluster_count):
+    # Drop faces that collapsed into a line or point, and duplicates of the same face
+    faces = inverse[faces]
+    keep = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 0] != faces[:, 2])
+    faces = faces[keep]
+    ordered = np.sort(faces, axis=1)
+    if cluster_count ** 3 < 2 ** 63:
+        keys = (ordered[:, 0] * cluster_count + ordered[:, 1]) * cluster_count + ordered[:, 2]
+        _, first = np.unique(keys, return_index=True)
+    else:
+        _, first = np.unique(ordered, axis=0, return_index=True)
+    return faces[np.sort(first)]
+
+
+def decimate(triangles, ratio, iterations=12):
+    """
+    Reduce a mesh to roughly ratio * its triangle count by vertex clustering.
+    The grid resolution is found by bisection so that the result is the
+    largest clustering that stays within the triangle budget.
+    """
+    target = max(int(len(triangles) * ratio), 1)
+    if ratio >= 1 or len(triangles) <= target:
+        return np.asarray(triangles, dtype=np.float32)
+
+    vertices, faces = weld(triangles)
+    vertices = vertices.astype(np.float64)
+    lower = vertices.min(axis=0)
+    extent = float((vertices.max(axis=0) - lower).max()) or 1.0
+
+    # Cells along the longest axis, coarse enough for 1 triangle and fine enough for all
+    low, high = 1, max(int(np.sqrt(len(triangles))) * 4, 2)
+    best = None
+    for _ in range(iterations):
+        resolution = (low + high) // 2
+        representatives, inverse = cluster_vertices(vertices, lower, extent / resolution)
+        clustered = cluster_faces(faces, inverse, len(representatives))
+        if len(clustered) <= target:
+            best = representatives[clustered]
+            low = resolution + 1
+        else:
+            high = resolution - 1
+        if low > high:
+            break
+
+    if best is None:
+        representatives, inverse = cluster_vertices(vertices, lower, extent)
+        best = representatives[cluster_faces(faces, inverse, len(representatives))]
+    return best.astype(np.float32)
+
+
+# Quantized indexed mesh ("qmesh"), a compact transport format:
+#
+#   header   '<4sHHII3f3f'  magic, version, index size in bytes (2 or 4),
+#                           vertex count, triangle count, origin xyz, scale xyz
+#   vertices uint16[vertex count, 3]     position = origin + q * scale
+#   indices  uint16|uint32[triangle count, 3]
+
+QMESH_MAGIC = b'QMSH'
+QMESH_VERSION = 1
+QMESH_HEADER = struct.Struct('<4sHHII3f3f')
+QMESH_MEDIA_TYPE = 'application/vnd.tsoles.qmesh'
+QUANTIZATION_STEPS = 65535
+
+
+def encode_qmesh(triangles):
+    """
+    Deduplicate vertices and quantize them to 16 bits over the bounding box.
+    The error per axis is at most half of extent / 65535.
+    """
+    vertices, faces = weld(triangles)
+    if len(vertices):
+        origin = vertices.min(axis=0).astype(np.float64)
+        extent = vertices.max(axis=0) - origin
+    else:
+        origin = extent = np.zeros(3)
+    scale = np.where(extent > 0, extent / QUANTIZATION_STEPS, 1.0)
+    quantized = np.rint((vertices - origin) / scale).astype('<u2')
+
+    index_dtype = np.dtype('<u2') if len(vertices) <= 0xFFFF else np.dtype('<u4')
+    header = QMESH_HEADER.pack(
+        QMESH_MAGIC, QMESH_VERSION, index_dtype.itemsize,
+        len(vertices), len(faces), *origin, *scale,
+    )
+    return header + quantized.tobytes() + faces.astype(index_dtype).tobytes()
+
+
+def decode_qmesh(data):
+    # Reference decoder, returns the (n, 3, 3) float32 triangles
+    magic, version, index_size, vertex_count, triangle_count, *params = QMESH_HEADER.unpack_from(data)
+    if magic != QMESH_MAGIC or version != QMESH_VERSION:
+        raise ValueError("Not a qmesh file.")
+    origin = np.array(params[:3])
+    scale = np.array(params[3:])
+    offset = QMESH_HEADER.size
+    quantized = np.frombuffer(data, dtype='<u2', count=vertex_count * 3, offset=offset).reshape(-1, 3)
+    offset += quantized.nbytes
+    index_dtype = '<u2' if index_size == 2 else '<u4'
+    faces = np.frombuffer(data, dtype=index_dtype, count=triangle_count * 3, offset=offset).reshape(-1, 3)
+    return (origin + quantized * scale).astype(np.float32)[faces]
+
+
+def transcode_to_binary(path):
+    """
+    Rewrite an ASCII STL as binary STL in place. Returns True if the file
+    was transcoded, False if it already was binary.
+    """
+    if binary_triangle_count(path) is not None:
+        return False
+    triangles = load_triangles(path)
+    tmp_path = f"{path}.tmp"
+    write_binary_stl(tmp_path, triangles, header=b'transcoded from ASCII STL')
+    os.replace(tmp_path, path)
+    return True
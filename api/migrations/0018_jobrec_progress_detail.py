@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_examination_content_hash_stlcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobrec',
+            name='detail',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='jobrec',
+            name='progress',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='jobrec',
+            name='job_name',
+            field=models.CharField(db_index=True, max_length=120),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_jobrec_progress_detail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='STLGeometry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(max_length=100)),
+                ('triangle_count', models.PositiveIntegerField()),
+                ('min_x', models.FloatField()),
+                ('min_y', models.FloatField()),
+                ('min_z', models.FloatField()),
+                ('max_x', models.FloatField()),
+                ('max_y', models.FloatField()),
+                ('max_z', models.FloatField()),
+                ('volume', models.FloatField()),
+                ('surface_area', models.FloatField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('examination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stl_geometry', to='api.examination')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('examination', 'filename'), name='unique_stl_geometry')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_blob'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='log',
+            name='hardwareCode',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='log',
+            name='softwareCode',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='log',
+            index=models.Index(fields=['hardwareCode', 'created_at'], name='log_hardware_created_idx'),
+        ),
+    ]
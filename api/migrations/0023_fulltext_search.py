@@ -0,0 +1,74 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# table, indexed columns; kept in step with api.search.SEARCH_FIELDS
+SEARCH_TABLES = [
+    ('api_log', ['hardwareCode', 'softwareCode', 'logTxt']),
+    ('api_bug', ['hardwareCode', 'softwareCode', 'bugTxt']),
+    ('api_ticket', ['title', 'body']),
+]
+
+
+def sqlite_statements(table, columns):
+    fts = f"{table}_fts"
+    cols = ', '.join(columns)
+    new = ', '.join(f"new.{c}" for c in columns)
+    old = ', '.join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def postgres_statement(table, columns):
+    vector = " || ' ' || ".join(f'coalesce("{c}", \'\')' for c in columns)
+    return f"CREATE INDEX {table}_search_idx ON {table} USING GIN (to_tsvector('simple', {vector}))"
+
+
+def create_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)")
+                cursor.execute("DROP TABLE temp.fts5_probe")
+            except OperationalError:
+                # SQLite built without FTS5, api.search falls back to LIKE
+                return
+            for table, columns in SEARCH_TABLES:
+                for statement in sqlite_statements(table, columns):
+                    cursor.execute(statement)
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for table, columns in SEARCH_TABLES:
+                cursor.execute(postgres_statement(table, columns))
+
+
+def drop_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for table, columns in SEARCH_TABLES:
+            if connection.vendor == 'sqlite':
+                for suffix in ('ai', 'ad', 'au'):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{suffix}")
+                cursor.execute(f"DROP TABLE IF EXISTS {table}_fts")
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f"DROP INDEX IF EXISTS {table}_search_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_log_append_only'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
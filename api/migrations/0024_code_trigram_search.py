@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:09
+
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+# table, code columns searched by substring; kept in step with api.search.CODE_FIELDS
+CODE_TABLES = [
+    ('api_log', ['hardwareCode', 'softwareCode']),
+    ('api_bug', ['hardwareCode', 'softwareCode']),
+    ('api_user', ['username', 'email', 'serial_number']),
+]
+
+
+def sqlite_statements(table, columns):
+    fts = f"{table}_codes_fts"
+    cols = ', '.join(columns)
+    new = ', '.join(f"new.{c}" for c in columns)
+    old = ', '.join(f"old.{c}" for c in columns)
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def postgres_statements(table, columns):
+    # Same expression Django emits for icontains, so those lookups use the index
+    return ["CREATE EXTENSION IF NOT EXISTS pg_trgm"] + [
+        f'CREATE INDEX {table}_{column.lower()}_trgm_idx ON {table} USING GIN (UPPER("{column}"::text) gin_trgm_ops)'
+        for column in columns
+    ]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute("CREATE VIRTUAL TABLE temp.trigram_probe USING fts5(x, tokenize='trigram')")
+                cursor.execute("DROP TABLE temp.trigram_probe")
+            except OperationalError:
+                # No FTS5 or SQLite older than 3.34, api.search falls back to LIKE
+                return
+            for table, columns in CODE_TABLES:
+                for statement in sqlite_statements(table, columns):
+                    cursor.execute(statement)
+    elif connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for table, columns in CODE_TABLES:
+                for statement in postgres_statements(table, columns):
+                    cursor.execute(statement)
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for table, columns in CODE_TABLES:
+            if connection.vendor == 'sqlite':
+                for suffix in ('ai', 'ad', 'au'):
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {table}_codes_fts_{suffix}")
+                cursor.execute(f"DROP TABLE IF EXISTS {table}_codes_fts")
+            elif connection.vendor == 'postgresql':
+                for column in columns:
+                    cursor.execute(f"DROP INDEX IF EXISTS {table}_{column.lower()}_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bug',
+            name='hardwareCode',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='bug',
+            name='softwareCode',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0028_bug_clusters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppVersionDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('file', 'file'), ('additional_file', 'additional_file')], default='file', max_length=20)),
+                ('patch', models.FileField(upload_to='app_versions/deltas/')),
+                ('patch_size', models.BigIntegerField()),
+                ('patch_sha256', models.CharField(max_length=64)),
+                ('source_sha256', models.CharField(max_length=64)),
+                ('target_sha256', models.CharField(max_length=64)),
+                ('target_size', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('from_version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deltas_from', to='api.appversion')),
+                ('to_version', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deltas', to='api.appversion')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('from_version', 'to_version', 'field'), name='unique_app_version_delta')],
+            },
+        ),
+    ]
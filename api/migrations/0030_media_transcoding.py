@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:28
+
+from django.db import migrations, models
+
+
+def mark_existing_ready(apps, schema_editor):
+    # Media uploaded before were converted during the request
+    MediaStorage = apps.get_model('api', 'MediaStorage')
+    MediaStorage.objects.update(status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_app_version_deltas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediastorage',
+            name='detail',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='mediastorage',
+            name='source_file',
+            field=models.FileField(blank=True, upload_to='media/source/'),
+        ),
+        migrations.AddField(
+            model_name='mediastorage',
+            name='status',
+            field=models.CharField(default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='mediastorage',
+            name='webp_file',
+            field=models.FileField(blank=True, upload_to='media/webp/'),
+        ),
+        migrations.AlterField(
+            model_name='mediastorage',
+            name='gif_file',
+            field=models.FileField(blank=True, upload_to='media/gif/'),
+        ),
+        migrations.RunPython(mark_existing_ready, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0031_write_behind_created_at'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='appversion',
+            index=models.Index(fields=['created_at', 'id'], name='appversion_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bugcluster',
+            index=models.Index(fields=['first_seen', 'id'], name='bugcluster_first_seen_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='examination',
+            index=models.Index(fields=['created_at', 'id'], name='examination_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['created_at', 'id'], name='ticket_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_joined', 'id'], name='user_date_joined_id_idx'),
+        ),
+    ]
@@ -1,11 +1,70 @@
+import os
+import shutil
+import uuid
+
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
+from api.counts import invalidate_counts_on_change
+
+class Blob(models.Model):
+    key = models.CharField(max_length=32, unique=True)
+    digest = models.CharField(max_length=64)
+    size = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.key} ({self.ref_count} refs)"
+
+
+def counted_file_fields(model):
+    return [
+        field for field in model._meta.fields
+        if isinstance(field, models.FileField) and hasattr(field.storage, 'release')
+    ]
+
+
+def release_stored_files(sender, instance, **kwargs):
+    # Drop one reference per file for content-addressed storages
+    for field in counted_file_fields(sender):
+        field.storage.release(getattr(instance, field.attname).name)
+
+
+def remember_stored_files(sender, instance, update_fields=None, **kwargs):
+    # The names a row pointed at before this save, see release_replaced_files
+    instance._stored_files = {}
+    fields = [field.attname for field in counted_file_fields(sender)
+              if update_fields is None or field.name in update_fields]
+    if instance.pk is None or not fields:
+        return
+    instance._stored_files = sender._default_manager.filter(pk=instance.pk).values(*fields).first() or {}
+
+
+def release_replaced_files(sender, instance, **kwargs):
+    # A file field given a new file no longer references the old blob
+    for attname, old_name in getattr(instance, '_stored_files', {}).items():
+        if old_name and old_name != getattr(instance, attname).name:
+            sender._meta.get_field(attname).storage.release(old_name)
+    instance._stored_files = {}
+
+
 class MediaStorage(models.Model):
+    # Uploaded images are converted to GIF and WebP by api.transcode
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+
     mp3_file = models.FileField(upload_to='media/mp3/')
-    gif_file = models.FileField(upload_to='media/gif/')
+    source_file = models.FileField(upload_to='media/source/', blank=True)
+    gif_file = models.FileField(upload_to='media/gif/', blank=True)
+    webp_file = models.FileField(upload_to='media/webp/', blank=True)
+    status = models.CharField(max_length=20, default=PENDING)
+    detail = models.TextField(blank=True, default='')
     uploaded_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -17,6 +76,13 @@ class Ticket(models.Model):
     body = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     active = models.BooleanField(default=True)
+
+    class Meta:
+        # Keyset pagination (api.pagination)
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='ticket_created_id_idx'),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -33,27 +99,128 @@ class AppVersion(models.Model):
     additional_file = models.FileField(upload_to='app_versions/', null=True, blank=True)  
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='appversion_created_id_idx'),
+        ]
+
     def __str__(self):
         return f"Version {self.version_number}"
 
 
+class AppVersionDelta(models.Model):
+    # Binary patch (bsdiff) turning a file of an older version into the same
+    # file of a newer one, built by api.deltas after an upload
+    FILE_FIELDS = ['file', 'additional_file']
+
+    from_version = models.ForeignKey(AppVersion, on_delete=models.CASCADE, related_name='deltas_from')
+    to_version = models.ForeignKey(AppVersion, on_delete=models.CASCADE, related_name='deltas')
+    field = models.CharField(max_length=20, choices=[(name, name) for name in FILE_FIELDS], default='file')
+    patch = models.FileField(upload_to='app_versions/deltas/')
+    patch_size = models.BigIntegerField()
+    patch_sha256 = models.CharField(max_length=64)
+    source_sha256 = models.CharField(max_length=64)
+    target_sha256 = models.CharField(max_length=64)
+    target_size = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['from_version', 'to_version', 'field'], name='unique_app_version_delta'),
+        ]
+
+    def __str__(self):
+        return f"{self.field} delta {self.from_version_id} -> {self.to_version_id}"
+
+
 
 class Bug(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='bugs')
-    hardwareCode = models.CharField(max_length=100, unique=False)
-    softwareCode = models.CharField(max_length=100, unique=False)
+    hardwareCode = models.CharField(max_length=100, unique=False, db_index=True)
+    softwareCode = models.CharField(max_length=100, unique=False, db_index=True)
     bugTxt = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, which would restamp rows saved later by api.writebehind
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+    # Set at insert time, see api.fingerprint
+    fingerprint = models.CharField(max_length=40, blank=True, default='', db_index=True)
+    simhash = models.BigIntegerField(null=True, blank=True)
+    cluster = models.ForeignKey('BugCluster', on_delete=models.SET_NULL, null=True, blank=True, related_name='bugs')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='bug_created_id_idx'),
+        ]
+
     def __str__(self):
         return f"Bug {self.id} by {self.user.username}"
 
 
+class BugCluster(models.Model):
+    """
+    Bugs whose normalized text is identical or within a few bits of SimHash
+    distance. band0-band3 are the signature's 16-bit bands, indexed for
+    near-duplicate lookups.
+    """
+    simhash = models.BigIntegerField()
+    band0 = models.PositiveIntegerField(db_index=True)
+    band1 = models.PositiveIntegerField(db_index=True)
+    band2 = models.PositiveIntegerField(db_index=True)
+    band3 = models.PositiveIntegerField(db_index=True)
+    sample_text = models.TextField()
+    bug_count = models.PositiveIntegerField(default=0)
+    last_bug_id = models.BigIntegerField(null=True, blank=True)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['first_seen', 'id'], name='bugcluster_first_seen_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Cluster {self.id} ({self.bug_count} bugs)"
+
+
+def fingerprint_new_bug(sender, instance, raw=False, **kwargs):
+    # Only the text here, the cluster is assigned once the INSERT succeeded
+    if instance.pk is None and (not instance.fingerprint or instance.simhash is None) and not raw:
+        from api.fingerprint import fingerprint_bug
+
+        fingerprint_bug(instance)
+
+def cluster_created_bug(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        from api.fingerprint import cluster_new_bug
+
+        cluster_new_bug(instance)
+
+def uncount_deleted_bug(sender, instance, **kwargs):
+    # Also runs for the rows archive_older_than deletes, Bug has delete receivers
+    if instance.cluster_id:
+        from api.fingerprint import uncount_in_cluster
+
+        uncount_in_cluster(instance)
+
+pre_save.connect(fingerprint_new_bug, sender=Bug)
+post_save.connect(cluster_created_bug, sender=Bug)
+post_delete.connect(uncount_deleted_bug, sender=Bug)
+
+
 class Log(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='logs', on_delete=models.CASCADE)
-    hardwareCode = models.CharField(max_length=100, unique=True)
-    softwareCode = models.CharField(max_length=100, unique=True)
+    hardwareCode = models.CharField(max_length=100, db_index=True)
+    softwareCode = models.CharField(max_length=100, db_index=True)
     logTxt = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add, which would restamp rows saved later by api.writebehind
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        # Logs are append-only, a device has many entries read newest first
+        indexes = [
+            models.Index(fields=['hardwareCode', 'created_at'], name='log_hardware_created_idx'),
+            models.Index(fields=['created_at', 'id'], name='log_created_id_idx'),
+        ]
+
     def __str__(self):
         return f"{self.hardwareCode} - {self.logTxt}"
 
@@ -64,6 +231,12 @@ class User(AbstractUser):
     phone_number = models.CharField(max_length=15, unique=False, blank=True , null=True)  
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'serial_number', 'phone_number'] 
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['date_joined', 'id'], name='user_date_joined_id_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -88,6 +261,23 @@ def save_user_profile(sender, instance, **kwargs):
 post_save.connect(create_user_profile, sender=settings.AUTH_USER_MODEL) 
 post_save.connect(save_user_profile, sender=settings.AUTH_USER_MODEL)  
 
+def invalidate_authenticated_user(sender, instance, **kwargs):
+    from api.authentication import invalidate_cached_user
+
+    invalidate_cached_user(instance.user_id if sender is Profile else instance.pk)
+
+for auth_model in (User, Profile):
+    post_save.connect(invalidate_authenticated_user, sender=auth_model)
+    post_delete.connect(invalidate_authenticated_user, sender=auth_model)
+
+def add_blacklisted_token(sender, instance, created, **kwargs):
+    from api.blacklist import blacklist_filter
+
+    if created:
+        blacklist_filter.add(instance.token.jti)
+
+post_save.connect(add_blacklisted_token, sender='token_blacklist.BlacklistedToken')
+
 
 class Examination(models.Model):
     customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='examinations')
@@ -98,12 +288,182 @@ class Examination(models.Model):
     has_shoe = models.BooleanField(default=False)
     single_foot = models.BooleanField(default=False)
     download = models.FileField(upload_to='downloads/')  
+    content_hash = models.CharField(max_length=64, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='examination_created_id_idx'),
+        ]
+
     def __str__(self):
         return self.design_title
 
+
+class UploadSession(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    customer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    metadata = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.offset}/{self.size})"
+
+    @property
+    def path(self):
+        return os.path.join(settings.CHUNKED_UPLOAD_DIR, str(self.id))
+
+
+def delete_upload_session_file(sender, instance, **kwargs):
+    if os.path.exists(instance.path):
+        os.remove(instance.path)
+
+post_delete.connect(delete_upload_session_file, sender=UploadSession)
+
+for file_model in (MediaStorage, AppVersion, AppVersionDelta, Profile, Examination):
+    post_delete.connect(release_stored_files, sender=file_model)
+    pre_save.connect(remember_stored_files, sender=file_model)
+    post_save.connect(release_replaced_files, sender=file_model)
+
+# Paginated list endpoints cache their counts (api.counts)
+for counted_model in (User, Bug, Log, Ticket, AppVersion, Examination):
+    post_save.connect(invalidate_counts_on_change, sender=counted_model)
+    post_delete.connect(invalidate_counts_on_change, sender=counted_model)
+
+def invalidate_latest_version(sender, **kwargs):
+    from api.versions import invalidate_latest_manifest
+
+    invalidate_latest_manifest(sender, **kwargs)
+
+post_save.connect(invalidate_latest_version, sender=AppVersion)
+post_delete.connect(invalidate_latest_version, sender=AppVersion)
+
+
+class STLCacheEntry(models.Model):
+    examination = models.ForeignKey(Examination, on_delete=models.CASCADE, related_name='stl_cache_entries')
+    key = models.CharField(max_length=120, unique=True)
+    filenames = models.JSONField(default=list)
+    size_bytes = models.BigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_accessed = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.key
+
+    @property
+    def path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'stl_files', self.key)
+
+
+class STLGeometry(models.Model):
+    examination = models.ForeignKey(Examination, on_delete=models.CASCADE, related_name='stl_geometry')
+    filename = models.CharField(max_length=100)
+    triangle_count = models.PositiveIntegerField()
+    min_x = models.FloatField()
+    min_y = models.FloatField()
+    min_z = models.FloatField()
+    max_x = models.FloatField()
+    max_y = models.FloatField()
+    max_z = models.FloatField()
+    volume = models.FloatField()
+    surface_area = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['examination', 'filename'], name='unique_stl_geometry'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} of examination {self.examination_id}"
+
+
+def delete_stl_cache_files(sender, instance, **kwargs):
+    shutil.rmtree(instance.path, ignore_errors=True)
+
+post_delete.connect(delete_stl_cache_files, sender=STLCacheEntry)
+
 class JobRec(models.Model):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
     status = models.CharField(max_length=120)
-    job_name = models.CharField(max_length=120)
+    job_name = models.CharField(max_length=120, db_index=True)
     date = models.DateTimeField()
+    progress = models.PositiveSmallIntegerField(default=0)
+    detail = models.TextField(blank=True, default='')
+
+    def __str__(self):
+        return f"{self.job_name} ({self.status})"
+
+
+class BugDailyCount(models.Model):
+    day = models.DateField()
+    hardwareCode = models.CharField(max_length=100)
+    softwareCode = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'hardwareCode', 'softwareCode'], name='unique_bug_daily_count'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} {self.hardwareCode}/{self.softwareCode}: {self.count}"
+
+
+class LogHourlyCount(models.Model):
+    hour = models.DateTimeField()
+    hardwareCode = models.CharField(max_length=100)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['hour', 'hardwareCode'], name='unique_log_hourly_count'),
+        ]
+
+    def __str__(self):
+        return f"{self.hour} {self.hardwareCode}: {self.count}"
+
+
+def update_rollups(sender, instance, created, **kwargs):
+    if created:
+        from api.analytics import record_created
+
+        record_created(sender, [instance])
+
+for rolled_up_model in (Bug, Log):
+    post_save.connect(update_rollups, sender=rolled_up_model)
+
+
+class ArchiveSegment(models.Model):
+    """
+    One gzip member of an archive file under ARCHIVE_DIR, holding rows
+    moved out of the database by archive_old_rows (see api.archive).
+    """
+    model_label = models.CharField(max_length=100)
+    month = models.CharField(max_length=7)
+    path = models.CharField(max_length=255)
+    offset = models.BigIntegerField()
+    length = models.BigIntegerField()
+    row_count = models.PositiveIntegerField()
+    min_id = models.BigIntegerField()
+    max_id = models.BigIntegerField()
+    min_created = models.DateTimeField()
+    max_created = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['model_label', 'min_id'], name='archive_segment_id_idx'),
+            models.Index(fields=['model_label', 'max_created'], name='archive_segment_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model_label} {self.month} ids {self.min_id}-{self.max_id}"
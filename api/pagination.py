@@ -0,0 +1,143 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.counts import CachedCountPaginator
+from api.search import is_ranked
+
+
+class KeysetPageNumberPagination(PageNumberPagination):
+    """
+    Page number pagination with an opt-in keyset (cursor) mode.
+
+    Without a cursor parameter responses are unchanged: count, next,
+    previous and results, with unordered querysets ordered by primary key so
+    pages do not shift. Passing cursor (empty for the first page) switches
+    to keyset mode: rows newest first on cursor_ordering, continued from the
+    position encoded in the cursor instead of an OFFSET, and no count query.
+    Search results stay in page-number mode to keep their relevance order.
+
+    Page-number counts come from api.counts; an estimated count adds
+    count_approximate to the response.
+    """
+
+    django_paginator_class = CachedCountPaginator
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor.'
+
+    # (timestamp field, unique tie-breaker); both must be indexed together,
+    # see the *_created_id_idx indexes
+    cursor_ordering = ('created_at', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Keyset mode needs a queryset; other sequences (api.archive.TieredRows) page by number
+        self.keyset = (
+            self.cursor_query_param in request.query_params
+            and hasattr(queryset, 'order_by')
+            and not is_ranked(queryset)
+        )
+        if not self.keyset:
+            if hasattr(queryset, 'ordered') and not queryset.ordered:
+                queryset = queryset.order_by('pk')
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+        field, tiebreak = self.cursor_ordering
+
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor is None:
+            position, reverse = None, False
+        else:
+            position, reverse = cursor
+
+        if reverse:
+            # Walking back towards newer rows: read ascending, then flip
+            queryset = queryset.order_by(field, tiebreak)
+            if position is not None:
+                value, key = position
+                queryset = queryset.filter(Q(**{f"{field}__gt": value}) | Q(**{field: value, f"{tiebreak}__gt": key}))
+        else:
+            queryset = queryset.order_by(f"-{field}", f"-{tiebreak}")
+            if position is not None:
+                value, key = position
+                queryset = queryset.filter(Q(**{f"{field}__lt": value}) | Q(**{field: value, f"{tiebreak}__lt": key}))
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.model = queryset.model
+        self.has_next = has_more if not reverse else True
+        self.has_previous = has_more if reverse else position is not None
+        self.page_results = results
+        return results
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            response = super().get_paginated_response(data)
+            if self.page.paginator.approximate:
+                response.data['count_approximate'] = True
+            return response
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or not self.page_results:
+            return None
+        return self.cursor_link(self.page_results[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous:
+            return None
+        if not self.page_results:
+            # Ran past the last row; the previous page starts from the top
+            return replace_query_param(remove_query_param(self.base_url, self.cursor_query_param),
+                                       self.cursor_query_param, '')
+        return self.cursor_link(self.page_results[0], reverse=True)
+
+    def cursor_link(self, obj, reverse):
+        field, tiebreak = self.cursor_ordering
+        payload = {
+            'v': self.model._meta.get_field(field).value_to_string(obj),
+            'k': self.model._meta.get_field(tiebreak).value_to_string(obj),
+            'r': int(reverse),
+        }
+        encoded = base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, model):
+        """
+        Return ((value, key), reverse) from the cursor parameter, None for
+        the first page.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        field, tiebreak = self.cursor_ordering
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            value = model._meta.get_field(field).to_python(payload['v'])
+            key = model._meta.get_field(tiebreak).to_python(payload['k'])
+            reverse = bool(payload['r'])
+        except (TypeError, ValueError, KeyError, binascii.Error, ValidationError) as e:
+            raise NotFound(self.invalid_cursor_message) from e
+        return (value, key), reverse
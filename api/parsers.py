@@ -0,0 +1,66 @@
+import csv
+import io
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class InvalidRecord:
+    """
+    Placeholder for an NDJSON line that is not a JSON object, so one bad
+    line is reported on its own instead of failing the whole batch.
+    """
+
+    def __init__(self, error):
+        self.error = error
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON into a list of records, one per non-empty line.
+    """
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        records = []
+        if stream is None:
+            return records
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line.decode(encoding))
+            except (UnicodeDecodeError, ValueError) as e:
+                records.append(InvalidRecord(f"Invalid JSON: {e}"))
+                continue
+            if not isinstance(record, dict):
+                records.append(InvalidRecord("Each line must be a JSON object."))
+                continue
+            records.append(record)
+        return records
+
+
+class CSVParser(BaseParser):
+    """
+    Parses CSV with a header row into a list of records, one dict per row.
+    Empty cells are left out of the record.
+    """
+
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if stream is None:
+            return []
+        try:
+            reader = csv.DictReader(io.StringIO(stream.read().decode(encoding), newline=''))
+            return [{key: value for key, value in row.items() if key and value} for row in reader]
+        except (UnicodeDecodeError, csv.Error) as e:
+            raise ParseError(f"CSV parse error - {e}")
@@ -0,0 +1,151 @@
+import logging
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from api.counts import invalidate_counts
+from api.jobs import discard_process_pool, get_process_pool
+from api.models import Profile, User
+from api.parsers import InvalidRecord
+
+logger = logging.getLogger(__name__)
+
+# Fields that must be unique across the batch and the existing users
+UNIQUE_FIELDS = ('email', 'username', 'serial_number')
+
+# Fewer passwords than this are hashed inline, a pool is not worth starting
+POOL_MIN_PASSWORDS = 8
+
+POOL_NAME = 'password-hashing'
+
+# Stays under SQLite's limit on query parameters
+LOOKUP_CHUNK_SIZE = 500
+
+
+def hash_workers():
+    return getattr(settings, 'USER_PROVISION_HASH_WORKERS', None) or os.cpu_count() or 1
+
+
+def get_hash_pool():
+    return get_process_pool(POOL_NAME, hash_workers())
+
+
+def hash_passwords(passwords):
+    """
+    Hash passwords (None gives an unusable password) in the process pool.
+    A broken pool is replaced and the batch hashed once more.
+    """
+    to_hash = [password for password in passwords if password is not None]
+    if len(to_hash) < POOL_MIN_PASSWORDS:
+        return [make_password(password) for password in passwords]
+    chunksize = max(len(to_hash) // (hash_workers() * 4), 1)
+    try:
+        hashed = list(get_hash_pool().map(make_password, to_hash, chunksize=chunksize))
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); later batches get a new pool too
+        logger.warning("Password hashing pool broke, retrying with a new pool")
+        discard_process_pool(POOL_NAME)
+        try:
+            hashed = list(get_hash_pool().map(make_password, to_hash, chunksize=chunksize))
+        except BrokenProcessPool:
+            discard_process_pool(POOL_NAME)
+            raise
+    hashed = iter(hashed)
+    return [next(hashed) if password is not None else make_password(None) for password in passwords]
+
+
+def existing_values(field, values):
+    """
+    Return which of values are already taken in User.field, in one query per
+    LOOKUP_CHUNK_SIZE values.
+    """
+    values = list(values)
+    taken = set()
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        chunk = values[start:start + LOOKUP_CHUNK_SIZE]
+        taken.update(User.objects.filter(**{f"{field}__in": chunk}).values_list(field, flat=True))
+    return taken
+
+
+def check_unique(rows):
+    """
+    Return {index: errors} for rows (index, validated data) whose unique
+    fields repeat an earlier row of the batch or an existing user.
+    """
+    errors = {}
+    for field in UNIQUE_FIELDS:
+        first_seen = {}
+        for index, data in rows:
+            value = data.get(field)
+            if not value:
+                continue
+            if value in first_seen:
+                errors.setdefault(index, {})[field] = [f"Duplicate {field} in this batch (row {first_seen[value]})."]
+            else:
+                first_seen[value] = index
+        for value in existing_values(field, first_seen):
+            errors.setdefault(first_seen[value], {})[field] = [f"This {field} is already in use."]
+    return errors
+
+
+def provision_users(records, dry_run=False):
+    """
+    Validate and create users with their profiles from records, a list of
+    dicts, without going through RegisterSerializer and the post_save hooks.
+    Rows are validated field by field, uniqueness is checked with set-based
+    queries, passwords are hashed in a process pool and users and profiles
+    are inserted with bulk_create in one transaction.
+
+    Returns (created users, errors) where errors is a list of
+    {"index", "errors"} for the rows that were skipped.
+    """
+    from api.serializer import ProvisionUserSerializer
+
+    valid = []
+    errors = {}
+    for index, record in enumerate(records):
+        if isinstance(record, InvalidRecord):
+            errors[index] = {"non_field_errors": [record.error]}
+            continue
+        if not isinstance(record, dict):
+            errors[index] = {"non_field_errors": ["Each user must be an object."]}
+            continue
+        serializer = ProvisionUserSerializer(data=record)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors[index] = serializer.errors
+
+    errors.update(check_unique(valid))
+    valid = [(index, data) for index, data in valid if index not in errors]
+    error_list = [{"index": index, "errors": errors[index]} for index in sorted(errors)]
+    if dry_run or not valid:
+        return [], error_list
+
+    passwords = hash_passwords([data.get('password') for index, data in valid])
+    users = [
+        User(
+            username=data['username'],
+            email=data['email'],
+            serial_number=data.get('serial_number'),
+            phone_number=data.get('phone_number'),
+            password=password,
+        )
+        for (index, data), password in zip(valid, passwords)
+    ]
+    with transaction.atomic():
+        users = User.objects.bulk_create(users, batch_size=500)
+        # bulk_create sends no post_save, so create_user_profile doesn't run
+        Profile.objects.bulk_create(
+            [
+                Profile(user=user, full_name=data.get('full_name', ''), bio=data.get('bio', ''))
+                for user, (index, data) in zip(users, valid)
+            ],
+            batch_size=500,
+        )
+    invalidate_counts(User)
+    logger.info(f"Provisioned {len(users)} users")
+    return users, error_list
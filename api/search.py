@@ -0,0 +1,381 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, Case, FloatField, Q, TextField, Value, When
+from django.db.models.expressions import RawSQL
+
+from api.models import Bug, Log, Ticket, User
+
+# Searchable columns per model and the column snippets are cut from.
+# The FTS5 tables and PostgreSQL GIN indexes in migration 0023 mirror this.
+SEARCH_FIELDS = {
+    Log: (['hardwareCode', 'softwareCode', 'logTxt'], 'logTxt'),
+    Bug: (['hardwareCode', 'softwareCode', 'bugTxt'], 'bugTxt'),
+    Ticket: (['title', 'body'], 'body'),
+}
+
+# Identifier columns matched by substring; the trigram FTS5 tables and
+# pg_trgm indexes in migration 0024 mirror this.
+CODE_FIELDS = {
+    Log: ['hardwareCode', 'softwareCode'],
+    Bug: ['hardwareCode', 'softwareCode'],
+    User: ['username', 'email', 'serial_number'],
+}
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# A single word made of code characters, e.g. a hardware code, serial or email
+CODE_RE = re.compile(r'^[\w.@+:/-]{4,}$', re.UNICODE)
+
+WHITESPACE_RE = re.compile(r'\s')
+
+# The trigram tokenizer cannot look up anything shorter than one trigram
+TRIGRAM_MIN_LENGTH = 3
+
+
+def query_tokens(query):
+    return TOKEN_RE.findall(query or '')
+
+
+def fts_match(tokens):
+    # Every token as a prefix, so results update while the user types
+    return ' '.join('"%s"*' % token for token in tokens)
+
+
+def looks_like_code(query):
+    return bool(CODE_RE.match(query or ''))
+
+
+def any_field(fields, lookup, value):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f"{field}__{lookup}": value})
+    return condition
+
+
+def prefix_condition(fields, prefix):
+    # A range on the column's b-tree index; LIKE 'x%' cannot use it on SQLite
+    # because LIKE is case-insensitive there. startswith keeps the range exact.
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{
+            f"{field}__gte": prefix,
+            f"{field}__lt": prefix + '\U0010ffff',
+            f"{field}__startswith": prefix,
+        })
+    return condition
+
+
+class LikeSearchBackend:
+    """
+    Fallback for databases without a full-text index: the original chained
+    icontains filters, unranked and without snippets.
+    """
+
+    def search(self, queryset, query):
+        fields, _ = SEARCH_FIELDS[queryset.model]
+        return queryset.filter(any_field(fields, 'icontains', query))
+
+    def substring(self, queryset, query):
+        return queryset.filter(any_field(CODE_FIELDS[queryset.model], 'icontains', query))
+
+    def matching(self, queryset, query):
+        """
+        Condition for the rows search() would return, to combine with others.
+        """
+        fields, _ = SEARCH_FIELDS[queryset.model]
+        return any_field(fields, 'icontains', query)
+
+    def ranked(self, queryset, query):
+        """
+        Annotate search_rank and search_snippet without filtering; rows the
+        text query doesn't match rank last and get no snippet. Returns the queryset and the
+        ordering for best first, None when unranked.
+        """
+        return queryset, None
+
+
+class SQLiteFTSBackend(LikeSearchBackend):
+    """
+    Queries the FTS5 external-content tables <table>_fts, which triggers on
+    the base tables keep in sync. Every token is matched as a prefix so
+    results update while the user types; best bm25 rank first.
+
+    Substring lookups on codes use the trigram tables <table>_codes_fts.
+    Either kind of table may be missing, in which case that lookup falls
+    back to LIKE.
+    """
+
+    def __init__(self, fulltext=True, trigram=True):
+        self.fulltext = fulltext
+        self.trigram = trigram
+
+    def search(self, queryset, query):
+        tokens = query_tokens(query)
+        if not self.fulltext or not tokens:
+            return super().search(queryset, query)
+
+        queryset, ordering = self.ranked(queryset.filter(self.matching(queryset, query)), query)
+        return queryset.order_by(ordering)
+
+    def matching(self, queryset, query):
+        tokens = query_tokens(query)
+        if not self.fulltext or not tokens:
+            return super().matching(queryset, query)
+        fts_table = f"{queryset.model._meta.db_table}_fts"
+        return Q(pk__in=RawSQL(f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s", [fts_match(tokens)]))
+
+    def ranked(self, queryset, query):
+        tokens = query_tokens(query)
+        if not self.fulltext or not tokens:
+            return super().ranked(queryset, query)
+        table = queryset.model._meta.db_table
+        fts_table = f"{table}_fts"
+        # All matches with their rank and snippet. LIMIT -1 keeps SQLite from
+        # flattening it into a MATCH per row: it is materialized once and
+        # looked up by rowid, so rows matched another way stay in the result.
+        matches = (
+            f"(SELECT rowid AS id, bm25({fts_table}) AS rank, snippet({fts_table}, -1, %s, %s, '…', 16) AS snippet "
+            f"FROM {fts_table} WHERE {fts_table} MATCH %s LIMIT -1)"
+        )
+        params = [SNIPPET_START, SNIPPET_END, fts_match(tokens)]
+        queryset = queryset.annotate(
+            # bm25 is negative, 0 sorts rows without a text match last like ts_rank
+            search_rank=RawSQL(f"coalesce((SELECT m.rank FROM {matches} m WHERE m.id = {table}.id), 0)",
+                               params, output_field=FloatField()),
+            search_snippet=RawSQL(f"(SELECT m.snippet FROM {matches} m WHERE m.id = {table}.id)",
+                                  params, output_field=TextField()),
+        )
+        return queryset, 'search_rank'
+
+    def substring(self, queryset, query):
+        if not self.trigram or len(query) < TRIGRAM_MIN_LENGTH:
+            return super().substring(queryset, query)
+
+        fts_table = f"{queryset.model._meta.db_table}_codes_fts"
+        # One quoted phrase is a case-insensitive substring match with the trigram tokenizer
+        phrase = '"%s"' % query.replace('"', '""')
+        return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s", [phrase]))
+
+
+class PostgresSearchBackend(LikeSearchBackend):
+    """
+    Matches against to_tsvector('simple', ...) over the same columns, using
+    the expression GIN index, ranked with ts_rank and highlighted with
+    ts_headline. Substring lookups stay icontains, which the pg_trgm
+    indexes on UPPER(column) serve.
+    """
+
+    def search(self, queryset, query):
+        tokens = query_tokens(query)
+        if not tokens:
+            return super().search(queryset, query)
+
+        vector = search_vector_sql(queryset.model._meta.db_table, SEARCH_FIELDS[queryset.model][0])
+        terms = ' & '.join(f"{token}:*" for token in tokens)
+        # A plain condition rather than matching()'s subquery, so the GIN index is used directly
+        queryset = queryset.filter(RawSQL(f"{vector} @@ to_tsquery('simple', %s)", [terms], output_field=BooleanField()))
+        queryset, ordering = self.ranked(queryset, query)
+        return queryset.order_by(ordering)
+
+    def matching(self, queryset, query):
+        tokens = query_tokens(query)
+        if not tokens:
+            return super().matching(queryset, query)
+        table = queryset.model._meta.db_table
+        vector = search_vector_sql(table, SEARCH_FIELDS[queryset.model][0])
+        terms = ' & '.join(f"{token}:*" for token in tokens)
+        return Q(pk__in=RawSQL(f'SELECT "{table}"."id" FROM "{table}" WHERE {vector} @@ to_tsquery(\'simple\', %s)', [terms]))
+
+    def ranked(self, queryset, query):
+        tokens = query_tokens(query)
+        if not tokens:
+            return super().ranked(queryset, query)
+        table = queryset.model._meta.db_table
+        fields, snippet_field = SEARCH_FIELDS[queryset.model]
+        vector = search_vector_sql(table, fields)
+        tsquery = "to_tsquery('simple', %s)"
+        terms = ' & '.join(f"{token}:*" for token in tokens)
+        options = f"StartSel={SNIPPET_START}, StopSel={SNIPPET_END}, MinWords=8, MaxWords=24"
+        # ts_rank is 0 and ts_headline the plain text start for rows matched another way
+        queryset = queryset.annotate(
+            search_rank=RawSQL(f"ts_rank({vector}, {tsquery})", [terms], output_field=FloatField()),
+            search_snippet=RawSQL(f'ts_headline(\'simple\', "{table}"."{snippet_field}", {tsquery}, %s)',
+                                  [terms, options], output_field=TextField()),
+        )
+        return queryset, '-search_rank'
+
+
+def search_vector_sql(table, fields):
+    # Must stay identical to the indexed expression for the GIN index to be used
+    columns = " || ' ' || ".join(f'coalesce("{table}"."{field}", \'\')' for field in fields)
+    return f"to_tsvector('simple', {columns})"
+
+
+def sqlite_index_tables():
+    """
+    Yield (model, indexed fields, FTS5 table) for every SQLite search index.
+    """
+    for model, (fields, _) in SEARCH_FIELDS.items():
+        yield model, fields, f"{model._meta.db_table}_fts"
+    for model, fields in CODE_FIELDS.items():
+        yield model, fields, f"{model._meta.db_table}_codes_fts"
+
+
+def fts_trigger_sql(table, fts, columns):
+    cols = ', '.join(columns)
+    new = ', '.join(f"new.{c}" for c in columns)
+    old = ', '.join(f"old.{c}" for c in columns)
+    return {
+        f"{fts}_ai": f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN "
+                     f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"{fts}_ad": f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN "
+                     f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"{fts}_au": f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE ON {table} BEGIN "
+                     f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+                     f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+    }
+
+
+def restore_fts_triggers(sender=None, using='default', **kwargs):
+    """
+    post_migrate hook: SQLite drops a table's triggers when a migration
+    rebuilds it, so recreate missing sync triggers and reindex that table.
+    """
+    from django.db import connections
+
+    conn = connections[using]
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        tables = set(conn.introspection.table_names(cursor))
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+        triggers = {row[0] for row in cursor.fetchall()}
+        for model, fields, fts in sqlite_index_tables():
+            if fts not in tables:
+                continue
+            columns = [model._meta.get_field(f).column for f in fields]
+            statements = fts_trigger_sql(model._meta.db_table, fts, columns)
+            if set(statements) <= triggers:
+                continue
+            for statement in statements.values():
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+_backend = None
+
+
+def fts_available(models=SEARCH_FIELDS, suffix='fts'):
+    with connection.cursor() as cursor:
+        tables = connection.introspection.table_names(cursor)
+    return all(f"{model._meta.db_table}_{suffix}" in tables for model in models)
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        if connection.vendor == 'sqlite':
+            _backend = SQLiteFTSBackend(
+                fulltext=fts_available(),
+                trigram=fts_available(CODE_FIELDS, 'codes_fts'),
+            )
+        elif connection.vendor == 'postgresql':
+            _backend = PostgresSearchBackend()
+        else:
+            _backend = LikeSearchBackend()
+    return _backend
+
+
+def is_ranked(queryset):
+    """
+    Whether queryset comes from search() or search_codes() and is ordered
+    by relevance.
+    """
+    return bool(set(queryset.query.annotations) & {'search_rank', 'code_rank'})
+
+
+def contains(obj, fields, needle):
+    return any(needle in (getattr(obj, field) or '').lower() for field in fields)
+
+
+def matches_query(obj, query):
+    """
+    Apply the rule search() applies in the database to a row that is not in
+    it (e.g. an archived log): every query token is a prefix of a word of
+    the searchable fields, and a single word may also be part of a code.
+    """
+    model = type(obj)
+    query = (query or '').strip()
+    fields, _ = SEARCH_FIELDS[model]
+    tokens = query_tokens(query.lower())
+    if not tokens:
+        # The backends fall back to icontains as well
+        return contains(obj, fields, query.lower())
+
+    words = set()
+    for field in fields:
+        words.update(query_tokens((getattr(obj, field) or '').lower()))
+    if all(any(word.startswith(token) for word in words) for token in tokens):
+        return True
+    if model in CODE_FIELDS and not WHITESPACE_RE.search(query):
+        return contains(obj, CODE_FIELDS[model], query.lower())
+    return False
+
+
+def code_rank(fields, query):
+    """
+    0 for an exact code match, 1 for a prefix match, 2 otherwise. Served by
+    the b-tree indexes on the code columns.
+    """
+    if not looks_like_code(query):
+        return Value(2)
+    return Case(
+        When(any_field(fields, 'exact', query), then=Value(0)),
+        When(prefix_condition(fields, query), then=Value(1)),
+        default=Value(2),
+    )
+
+
+def search_codes(queryset, query):
+    """
+    Filter queryset (Log, Bug or User) to rows whose code columns contain
+    query, using the trigram index where there is one. Exact and then prefix
+    matches of a query that looks like a whole code come first.
+    """
+    query = (query or '').strip()
+    fields = CODE_FIELDS[queryset.model]
+    matches = get_search_backend().substring(queryset, query)
+    return matches.annotate(code_rank=code_rank(fields, query)).order_by('code_rank', 'pk')
+
+
+def search(queryset, query):
+    """
+    Filter queryset (Log, Bug or Ticket) by a free text query. Ranked
+    backends order by relevance and annotate search_rank and search_snippet.
+
+    Full-text tokens cannot match part of a code, so a single word also
+    matches rows whose code columns contain it; those come first (exact and
+    prefix codes before substrings), then the text matches by rank.
+    """
+    query = (query or '').strip()
+    backend = get_search_backend()
+    if queryset.model not in CODE_FIELDS or not query or WHITESPACE_RE.search(query):
+        return backend.search(queryset, query)
+
+    fields = CODE_FIELDS[queryset.model]
+    codes = backend.substring(queryset, query).values('pk')
+    if not codes.exists():
+        return backend.search(queryset, query)
+
+    combined = queryset.filter(Q(pk__in=codes) | backend.matching(queryset, query))
+    combined = combined.annotate(code_rank=Case(
+        When(pk__in=codes, then=code_rank(fields, query)),
+        default=Value(3),
+    ))
+    combined, rank_order = backend.ranked(combined, query)
+    ordering = ['code_rank'] + ([rank_order] if rank_order is not None else []) + ['pk']
+    return combined.order_by(*ordering)
@@ -1,15 +1,22 @@
 
 
-from api.models import User, Bug, Log, AppVersion, Ticket , Examination , NameStorage , MediaStorage , JobRec
+from api.models import User, Bug, Log, AppVersion, AppVersionDelta, Ticket , Examination , NameStorage , MediaStorage , JobRec , STLGeometry , BugCluster
 from django.contrib.auth.password_validation import validate_password
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
+from api.stl import check_stl_archive
+from api.blacklist import FilteredRefreshToken
 
 class MediaStorageSerializer(serializers.ModelSerializer):
+    # The uploaded image; the stored GIF and WebP appear once status is ready
+    gif_file = serializers.FileField(required=False)
+
     class Meta:
         model = MediaStorage
-        fields = ['id', 'mp3_file', 'gif_file', 'uploaded_at']
+        fields = ['id', 'mp3_file', 'gif_file', 'webp_file', 'status', 'detail', 'uploaded_at']
+        read_only_fields = ['webp_file', 'status', 'detail']
 
 class UserDetailSerializer(serializers.ModelSerializer):
     class Meta:
@@ -19,18 +26,42 @@ class UserDetailSerializer(serializers.ModelSerializer):
 class BugSerializer(serializers.ModelSerializer):
     class Meta:
         model = Bug
-        fields = ['id', 'hardwareCode', 'softwareCode', 'bugTxt', 'created_at']
+        fields = ['id', 'hardwareCode', 'softwareCode', 'bugTxt', 'created_at', 'cluster']
+        read_only_fields = ['cluster']
+
+class BugClusterSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = BugCluster
+        fields = ['id', 'sample_text', 'bug_count', 'first_seen', 'last_seen', 'last_bug_id']
 
 class LogSerializer(serializers.ModelSerializer):
     class Meta:
         model = Log
         fields = ['id', 'hardwareCode', 'softwareCode', 'logTxt', 'created_at']
 
+class BugSearchSerializer(BugSerializer):
+    snippet = serializers.CharField(source='search_snippet', read_only=True, default=None)
+
+    class Meta(BugSerializer.Meta):
+        fields = BugSerializer.Meta.fields + ['snippet']
+
+class LogSearchSerializer(LogSerializer):
+    snippet = serializers.CharField(source='search_snippet', read_only=True, default=None)
+
+    class Meta(LogSerializer.Meta):
+        fields = LogSerializer.Meta.fields + ['snippet']
+
 class AppVersionSerializer(serializers.ModelSerializer):
     class Meta:
         model = AppVersion
         fields = ['id', 'version_number', 'file', 'additional_file', 'created_at']
 
+class AppVersionDeltaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AppVersionDelta
+        fields = ['from_version', 'to_version', 'field', 'patch', 'patch_size', 'patch_sha256',
+                  'source_sha256', 'target_sha256', 'target_size']
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
@@ -62,6 +93,12 @@ class TicketSerializer(serializers.ModelSerializer):
         ticket = Ticket.objects.create(customer=self.context['request'].user, **validated_data)
         return ticket
 
+class TicketSearchSerializer(TicketSerializer):
+    snippet = serializers.CharField(source='search_snippet', read_only=True, default=None)
+
+    class Meta(TicketSerializer.Meta):
+        fields = TicketSerializer.Meta.fields + ['snippet']
+
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
     @classmethod
     def get_token(cls, user):
@@ -75,6 +112,11 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         return token
 
 
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    # Checks the blacklist through the process-local Bloom filter
+    token_class = FilteredRefreshToken
+
+
 class RegisterSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(
         required=True,
@@ -134,6 +176,21 @@ class RegisterSerializer(serializers.ModelSerializer):
         return user
 
 
+class ProvisionUserSerializer(serializers.Serializer):
+    # Field checks only: api.provisioning checks uniqueness for the whole batch
+    email = serializers.EmailField(max_length=254)
+    username = serializers.CharField(max_length=150, validators=[UnicodeUsernameValidator()])
+    serial_number = serializers.CharField(max_length=100, required=False, allow_blank=True, allow_null=True)
+    phone_number = serializers.CharField(max_length=15, required=False, allow_blank=True, allow_null=True)
+    password = serializers.CharField(write_only=True, required=False, allow_null=True)
+    full_name = serializers.CharField(max_length=1000, required=False, allow_blank=True)
+    bio = serializers.CharField(max_length=100, required=False, allow_blank=True)
+
+    def validate_serial_number(self, value):
+        # Blank serials are stored as NULL so they don't collide
+        return value or None
+
+
 class ExaminationSerializer(serializers.ModelSerializer):
     customer_username = serializers.CharField(source='customer.username', read_only=True)
 
@@ -155,11 +212,37 @@ class ExaminationSerializer(serializers.ModelSerializer):
         
         if not value.name.endswith('.zip'):
             raise serializers.ValidationError("Only ZIP files are accepted for upload.")
+
+        # ExaminationZipUploadHandler already read the central directory
+        if not hasattr(value, 'stl_members'):
+            try:
+                value.stl_members = check_stl_archive(value)
+            except ValueError as e:
+                raise serializers.ValidationError(str(e))
+            finally:
+                value.seek(0)
         return value
+
+    def create(self, validated_data):
+        validated_data['content_hash'] = getattr(validated_data['download'], 'content_hash', '')
+        return super().create(validated_data)
     
+class STLGeometrySerializer(serializers.ModelSerializer):
+    bounding_box = serializers.SerializerMethodField()
+
+    class Meta:
+        model = STLGeometry
+        fields = ['filename', 'triangle_count', 'bounding_box', 'volume', 'surface_area']
+
+    def get_bounding_box(self, obj):
+        return {
+            'min': [obj.min_x, obj.min_y, obj.min_z],
+            'max': [obj.max_x, obj.max_y, obj.max_z],
+        }
+
 class JobRecSerializer(serializers.ModelSerializer):
     class Meta:
         model = JobRec
-        fields = ['status', 'job_name', 'date']
+        fields = ['status', 'job_name', 'date', 'progress', 'detail']
 
 
@@ -0,0 +1,449 @@
+import gzip
+import hashlib
+import os
+import shutil
+import tempfile
+import zipfile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from api.jobs import run_job, update_job
+from api.mesh import (
+    binary_triangle_count,
+    decimate,
+    encode_qmesh,
+    is_ascii_stl,
+    load_triangles,
+    mesh_stats,
+    transcode_to_binary,
+    write_binary_stl,
+)
+from api.models import Examination, STLCacheEntry, STLGeometry
+
+
+# STL members a scanner ZIP is expected to contain
+STL_FILENAMES = [
+    'Left_InternalStructure_Hollow.STL',
+    'Left_FootShoe.STL',
+    'Left_Skeleton.STL',
+    'Left_Insole_Floor.STL',
+    'Left_Insole_Roof.STL',
+    'Right_InternalStructure_Hollow.STL',
+    'Right_FootShoe.STL',
+    'Right_Skeleton.STL',
+    'Right_Insole_Floor.STL',
+    'Right_Insole_Roof.STL',
+]
+
+STL_DIR = 'stl_files'
+
+# Preview levels of detail, in percent of the original triangle count
+STL_LOD_LEVELS = [100, 25, 5]
+FULL_LOD = 100
+
+# Delivery formats: plain binary STL or the quantized indexed mesh from api.mesh
+OUTPUT_FORMATS = ['stl', 'qmesh']
+DEFAULT_OUTPUT = 'stl'
+
+ENCODING_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+# Copy buffer used when streaming members out of the archive
+CHUNK_SIZE = 1024 * 1024
+
+
+def open_examination_zip(examination):
+    # Open the uploaded ZIP through the storage backend instead of over HTTP
+    return examination.download.storage.open(examination.download.name, 'rb')
+
+
+def extract_members(archive, filenames, target_dir, progress=None):
+    """
+    Stream the requested STL members of an open ZIP file handle into target_dir.
+    Only the central directory and the selected members are read, so the
+    archive is never held in memory as a whole. Returns the extracted names.
+    progress, if given, is called with (done, total) after every member.
+    """
+    extracted = []
+    with zipfile.ZipFile(archive) as z:
+        members = set(z.namelist())
+        for index, stl_filename in enumerate(filenames, start=1):
+            if stl_filename in members:
+                os.makedirs(target_dir, exist_ok=True)
+                saved_stl_path = os.path.join(target_dir, stl_filename)
+                with z.open(stl_filename) as src, open(saved_stl_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+                extracted.append(stl_filename)
+
+            if progress:
+                progress(index, len(filenames))
+    return extracted
+
+
+def is_valid_stl(path):
+    """
+    Cheap structural check: a binary STL's size must match its triangle count,
+    otherwise the file has to look like an ASCII solid.
+    """
+    return binary_triangle_count(path) is not None or is_ascii_stl(path)
+
+
+ZIP_MAGIC = b'PK\x03\x04'
+
+
+def check_stl_archive(fileobj):
+    """
+    Read the ZIP central directory of an uploaded file and return the known
+    STL members it contains. Raises ValueError for anything that is not a
+    ZIP archive with at least one of them. Member data is not decompressed.
+    """
+    try:
+        with zipfile.ZipFile(fileobj) as z:
+            names = set(z.namelist())
+    except (zipfile.BadZipFile, EOFError):
+        raise ValueError("The uploaded file is not a valid ZIP archive.")
+    found = [name for name in STL_FILENAMES if name in names]
+    if not found:
+        raise ValueError("The ZIP archive contains none of the expected STL files.")
+    return found
+
+
+def select_filenames(requested_files=None):
+    # Keep the canonical order; an empty request means every known member
+    if not requested_files:
+        return list(STL_FILENAMES)
+    return [name for name in STL_FILENAMES if name in requested_files]
+
+
+def lod_dirname(lod):
+    return '' if lod == FULL_LOD else f"lod{lod}"
+
+
+def stl_url(key, stl_filename, lod=FULL_LOD):
+    if lod == FULL_LOD:
+        return f"{settings.MEDIA_URL}{STL_DIR}/{key}/{stl_filename}"
+    return f"{settings.MEDIA_URL}{STL_DIR}/{key}/{lod_dirname(lod)}/{stl_filename}"
+
+
+# Extraction cache
+#
+# Extracted members live in MEDIA_ROOT/stl_files/<examination id>-<zip sha256>/
+# so examinations never overwrite each other, and a STLCacheEntry row records
+# what was extracted, its size and when it was last served (for LRU eviction).
+
+DEFAULT_STL_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+
+def stl_cache_max_bytes():
+    return getattr(settings, 'STL_CACHE_MAX_BYTES', DEFAULT_STL_CACHE_MAX_BYTES)
+
+
+def hash_examination_zip(examination):
+    digest = hashlib.sha256()
+    with open_examination_zip(examination) as archive:
+        for chunk in iter(lambda: archive.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_content_hash(examination):
+    # Hash once and remember it on the row, later lookups never open the ZIP
+    if not examination.content_hash:
+        examination.content_hash = hash_examination_zip(examination)
+        examination.save(update_fields=['content_hash'])
+    return examination.content_hash
+
+
+def stl_cache_key(examination):
+    return f"{examination.id}-{get_content_hash(examination)}"
+
+
+def _directory_size(path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, dirs, files in os.walk(path)
+        for name in files
+    )
+
+
+def populate_stl_cache(examination, key, progress=None):
+    """
+    Extract every known STL member into the cache directory for key.
+    Members are written to a temporary directory first and moved into place,
+    so concurrent requests never serve a half-written file. Raises ValueError
+    if any member is not an STL file.
+    """
+    stl_root = os.path.join(settings.MEDIA_ROOT, STL_DIR)
+    final_dir = os.path.join(stl_root, key)
+    os.makedirs(stl_root, exist_ok=True)
+
+    tmp_dir = tempfile.mkdtemp(prefix=f".{key}-", dir=stl_root)
+    # mkdtemp is owner-only, the web server serving MEDIA_ROOT needs to read it
+    os.chmod(tmp_dir, 0o755)
+    try:
+        with open_examination_zip(examination) as archive:
+            filenames = extract_members(archive, STL_FILENAMES, tmp_dir, progress)
+        # Checked on the extracted bytes, transcoding would turn junk into an empty mesh
+        invalid = [name for name in filenames if not is_valid_stl(os.path.join(tmp_dir, name))]
+        if invalid:
+            raise ValueError(f"Invalid STL files: {', '.join(invalid)}")
+        # Cache binary STL only, ASCII is several times larger and slower to parse
+        for stl_filename in filenames:
+            transcode_to_binary(os.path.join(tmp_dir, stl_filename))
+        size_bytes = _directory_size(tmp_dir)
+        try:
+            os.rename(tmp_dir, final_dir)
+        except OSError:
+            # Another worker finished the same extraction first
+            if not os.path.isdir(final_dir):
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    now = timezone.now()
+    try:
+        entry, created = STLCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                'examination': examination,
+                'filenames': filenames,
+                'size_bytes': size_bytes,
+                'last_accessed': now,
+            },
+        )
+    except IntegrityError:
+        entry = STLCacheEntry.objects.get(key=key)
+    return entry
+
+
+def get_stl_cache_entry(examination, progress=None):
+    """
+    Return the cache entry for an examination, extracting it on a miss.
+    Hits only touch the database, never the ZIP.
+    """
+    key = stl_cache_key(examination)
+    entry = STLCacheEntry.objects.filter(key=key).first()
+    if entry is not None and os.path.isdir(entry.path):
+        STLCacheEntry.objects.filter(pk=entry.pk).update(last_accessed=timezone.now())
+        return entry
+
+    entry = populate_stl_cache(examination, key, progress)
+    evict_stl_cache(stl_cache_max_bytes(), keep=[entry.pk])
+    return entry
+
+
+def _atomic_write(target, write):
+    """
+    Call write(path) on a temporary file next to target, then move it into
+    place so readers never see a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(target)}-", dir=os.path.dirname(target))
+    os.close(fd)
+    os.chmod(tmp_path, 0o644)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return os.path.getsize(target)
+
+
+def _write_gzip(source, tmp_path):
+    with open(source, 'rb') as src, gzip.GzipFile(tmp_path, 'wb', mtime=0) as dst:
+        shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def _write_brotli(source, tmp_path):
+    compressor = brotli.Compressor()
+    with open(source, 'rb') as src, open(tmp_path, 'wb') as dst:
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            dst.write(compressor.process(chunk))
+        dst.write(compressor.finish())
+
+
+def precompressed_encodings():
+    # brotli is optional, gzip sidecars are always available
+    return ['br', 'gzip'] if brotli else ['gzip']
+
+
+def write_precompressed(path):
+    """
+    Write .gz (and .br when brotli is installed) sidecars next to path.
+    Returns the number of bytes written.
+    """
+    writers = {'gzip': _write_gzip, 'br': _write_brotli}
+    written = 0
+    for encoding in precompressed_encodings():
+        target = path + ENCODING_SUFFIXES[encoding]
+        if not os.path.exists(target):
+            written += _atomic_write(target, lambda tmp_path: writers[encoding](path, tmp_path))
+    return written
+
+
+def variant_filename(stl_filename, output):
+    if output == 'qmesh':
+        return os.path.splitext(stl_filename)[0] + '.qmesh'
+    return stl_filename
+
+
+def build_lod(entry, stl_filename, lod):
+    """
+    Write the decimated variant of a cached STL file for one level of detail.
+    Returns the number of bytes written, 0 if the variant already existed.
+    """
+    lod_dir = os.path.join(entry.path, lod_dirname(lod))
+    target = os.path.join(lod_dir, stl_filename)
+    if lod == FULL_LOD or os.path.exists(target):
+        return 0
+
+    os.makedirs(lod_dir, exist_ok=True)
+    triangles = decimate(load_triangles(os.path.join(entry.path, stl_filename)), lod / 100)
+    header = f"{stl_filename} LOD {lod}%".encode()
+    return _atomic_write(target, lambda tmp_path: write_binary_stl(tmp_path, triangles, header=header))
+
+
+def build_variant(entry, stl_filename, lod, output):
+    """
+    Make sure one STL file is cached at the given level of detail and output
+    format, together with its precompressed sidecars. Returns bytes written.
+    """
+    written = build_lod(entry, stl_filename, lod)
+    lod_dir = os.path.join(entry.path, lod_dirname(lod))
+    source = os.path.join(lod_dir, stl_filename)
+    target = os.path.join(lod_dir, variant_filename(stl_filename, output))
+
+    if output == 'qmesh' and not os.path.exists(target):
+        def write_qmesh(tmp_path):
+            with open(tmp_path, 'wb') as fh:
+                fh.write(encode_qmesh(load_triangles(source)))
+        written += _atomic_write(target, write_qmesh)
+
+    return written + write_precompressed(target)
+
+
+def build_variants(entry, filenames=None, lod_levels=STL_LOD_LEVELS, outputs=OUTPUT_FORMATS):
+    written = 0
+    for stl_filename in entry.filenames if filenames is None else filenames:
+        for lod in lod_levels:
+            for output in outputs:
+                written += build_variant(entry, stl_filename, lod, output)
+    if written:
+        STLCacheEntry.objects.filter(pk=entry.pk).update(size_bytes=F('size_bytes') + written)
+        # Variants can grow the cache past its limit long after the extraction
+        evict_stl_cache(stl_cache_max_bytes(), keep=[entry.pk])
+    return written
+
+
+def get_cached_stl_files(examination, requested_files=None, lod=FULL_LOD, output=DEFAULT_OUTPUT):
+    """
+    Return the requested STL files of an examination as dicts with the file
+    name, its url and the urls of its precompressed sidecars. The requested
+    level of detail and output format are built first if not cached yet.
+    """
+    entry = get_stl_cache_entry(examination)
+    filenames = [
+        stl_filename for stl_filename in select_filenames(requested_files)
+        if stl_filename in entry.filenames
+    ]
+    build_variants(entry, filenames, [lod], [output])
+
+    files = []
+    for stl_filename in filenames:
+        url = stl_url(entry.key, variant_filename(stl_filename, output), lod)
+        files.append({
+            'filename': stl_filename,
+            'url': url,
+            'compressed': {
+                encoding: url + ENCODING_SUFFIXES[encoding]
+                for encoding in precompressed_encodings()
+            },
+        })
+    return files
+
+
+def stl_cache_size():
+    return STLCacheEntry.objects.aggregate(total=Sum('size_bytes'))['total'] or 0
+
+
+def evict_stl_cache(max_bytes, keep=()):
+    """
+    Delete least recently used entries until the cache fits in max_bytes.
+    Returns the number of evicted entries.
+    """
+    total = stl_cache_size()
+    evicted = 0
+    if total <= max_bytes:
+        return evicted
+
+    for entry in STLCacheEntry.objects.exclude(pk__in=keep).order_by('last_accessed'):
+        if total <= max_bytes:
+            break
+        total -= entry.size_bytes
+        entry.delete()
+        evicted += 1
+    return evicted
+
+
+def extract_examination_job(job, examination_id):
+    """
+    Background job started at upload time: hash the ZIP, extract and validate
+    the known STL members, index their geometry and build every level of
+    detail and output format so the first fetch-stl call is a cache hit.
+    """
+    examination = Examination.objects.get(id=examination_id)
+
+    def progress(done, total):
+        update_job(job, progress=int(done * 100 / (total + 1)))
+
+    entry = get_stl_cache_entry(examination, progress)
+    missing = [name for name in STL_FILENAMES if name not in entry.filenames]
+
+    index_stl_geometry(examination, entry)
+    build_variants(entry)
+
+    detail = f"{len(entry.filenames)}/{len(STL_FILENAMES)} STL files ready."
+    if missing:
+        detail += f" Missing: {', '.join(missing)}"
+    return detail
+
+
+def index_stl_geometry(examination, entry):
+    """
+    Store triangle count, bounding box, volume and surface area of every
+    extracted STL file in the STLGeometry table.
+    """
+    rows = []
+    for stl_filename in entry.filenames:
+        stats = mesh_stats(os.path.join(entry.path, stl_filename))
+        rows.append(STLGeometry(examination=examination, filename=stl_filename, **stats))
+
+    try:
+        with transaction.atomic():
+            STLGeometry.objects.filter(examination=examination).delete()
+            STLGeometry.objects.bulk_create(rows)
+    except IntegrityError:
+        # Indexed concurrently (upload job and a first fetch); keep its rows,
+        # they describe the same files
+        return list(STLGeometry.objects.filter(examination=examination).order_by('filename'))
+    return rows
+
+
+def get_stl_geometry(examination):
+    # Index on demand for examinations uploaded before the background job existed
+    geometry = list(examination.stl_geometry.order_by('filename'))
+    if not geometry:
+        geometry = sorted(index_stl_geometry(examination, get_stl_cache_entry(examination)), key=lambda g: g.filename)
+    return geometry
+
+
+def schedule_stl_extraction(examination):
+    return run_job(f"stl-extract:{examination.id}", extract_examination_job, examination.id)
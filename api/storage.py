@@ -0,0 +1,120 @@
+import hashlib
+import os
+import shutil
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+from django.db.models import F
+
+# Stored names look like blobs/<2 hex>/<30 hex>/<original file name>, i.e. the
+# first 128 bits of the SHA-256 pick the directory and the upload keeps its name.
+BLOB_DIR = 'blobs'
+BLOB_KEY_LENGTH = 32
+
+
+def blob_key(name):
+    """
+    Return the content key of a stored name, None if it is not a blob
+    (e.g. files written before this storage was introduced).
+    """
+    parts = name.replace('\\', '/').split('/')
+    if len(parts) != 4 or parts[0] != BLOB_DIR:
+        return None
+    return parts[1] + parts[2]
+
+
+def blob_dirname(key):
+    return f"{BLOB_DIR}/{key[:2]}/{key[2:]}"
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps a single copy of identical content.
+    Each distinct content is a directory keyed by its hash; the same content
+    uploaded under another file name is hard-linked into that directory.
+    References are counted in the Blob table, unreferenced blobs are removed
+    by the gc_blobs management command.
+    """
+
+    def content_hash(self, content):
+        # Upload handlers may already have hashed the file while receiving it
+        digest = getattr(content, 'content_hash', None)
+        if digest:
+            return digest
+        sha = hashlib.sha256()
+        if hasattr(content, 'seek') and content.seekable():
+            content.seek(0)
+        for chunk in content.chunks():
+            sha.update(chunk)
+        if hasattr(content, 'seek') and content.seekable():
+            content.seek(0)
+        return sha.hexdigest()
+
+    def blob_name(self, key, name, max_length=None):
+        directory = blob_dirname(key)
+        filename = self.get_valid_name(os.path.basename(name))
+        if max_length and len(directory) + 1 + len(filename) > max_length:
+            stem, ext = os.path.splitext(filename)
+            keep = max(max_length - len(directory) - 1 - len(ext), 1)
+            filename = stem[:keep] + ext
+        return f"{directory}/{filename}"
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+
+        digest = self.content_hash(content)
+        key = digest[:BLOB_KEY_LENGTH]
+        name = self.blob_name(key, name, max_length)
+
+        # Reference the blob before looking at its files: gc_blobs only deletes
+        # a directory after removing its row at ref_count 0, so from here on
+        # the directory stays, or is already gone and gets written again
+        self.retain(key, digest, content.size)
+        if not self.exists(name):
+            sibling = self.find_sibling(key)
+            if sibling:
+                try:
+                    os.link(self.path(sibling), self.path(name))
+                except OSError:
+                    name = self._save(name, content)
+            else:
+                name = self._save(name, content)
+
+        validate_file_name(name, allow_relative_path=True)
+        return name
+
+    def find_sibling(self, key):
+        directory = blob_dirname(key)
+        if not self.exists(directory):
+            return None
+        _, files = self.listdir(directory)
+        return f"{directory}/{files[0]}" if files else None
+
+    def retain(self, key, digest, size):
+        from api.models import Blob
+
+        while True:
+            blob, created = Blob.objects.get_or_create(key=key, defaults={'digest': digest, 'size': size})
+            if Blob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1):
+                return
+            # Deleted by gc_blobs since the lookup, create it again
+
+    def release(self, name):
+        from api.models import Blob
+
+        key = blob_key(name or '')
+        if key:
+            Blob.objects.filter(key=key, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+
+    def delete_blob(self, key):
+        path = self.path(blob_dirname(key))
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            # Remove the two-character prefix directory once it is empty
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass
@@ -0,0 +1,158 @@
+import logging
+import os
+import tempfile
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageSequence, UnidentifiedImageError
+from django.conf import settings
+from django.core.files import File
+from django.db import connection
+
+from api.jobs import discard_process_pool, get_process_pool
+from api.models import MediaStorage
+
+logger = logging.getLogger(__name__)
+
+POOL_NAME = 'media-transcode'
+
+DEFAULT_TRANSCODE_WORKERS = 2
+# Largest source image accepted, in pixels per frame
+DEFAULT_MAX_PIXELS = 4096 * 4096
+# Output frames are scaled down to fit this box
+DEFAULT_MAX_DIMENSION = 1024
+DEFAULT_MAX_FRAMES = 500
+DEFAULT_WEBP_QUALITY = 75
+DEFAULT_FRAME_DURATION = 100
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def check_image(upload):
+    """
+    Cheap request-time check: upload is an image PIL can read and not
+    larger than MEDIA_MAX_PIXELS. Only the header is parsed. Raises
+    ValueError.
+    """
+    try:
+        with Image.open(upload) as image:
+            width, height = image.size
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise ValueError("The file is not a supported image.") from e
+    finally:
+        upload.seek(0)
+    if width * height > _setting('MEDIA_MAX_PIXELS', DEFAULT_MAX_PIXELS):
+        raise ValueError(f"The image is too large ({width}x{height}).")
+
+
+def load_frames(source):
+    """
+    Decode the frames of source scaled to fit MEDIA_MAX_DIMENSION, with
+    their durations and the loop count. JPEGs are decoded at a reduced
+    scale through Image.draft. Decoding stops after MEDIA_MAX_FRAMES frames
+    or once the kept frames hold MEDIA_MAX_PIXELS pixels, which bounds
+    memory for long animations. Returns (frames, durations, loop, truncated).
+    """
+    max_pixels = _setting('MEDIA_MAX_PIXELS', DEFAULT_MAX_PIXELS)
+    max_dimension = _setting('MEDIA_MAX_DIMENSION', DEFAULT_MAX_DIMENSION)
+    max_frames = _setting('MEDIA_MAX_FRAMES', DEFAULT_MAX_FRAMES)
+
+    with Image.open(source) as image:
+        if image.width * image.height > max_pixels:
+            raise ValueError(f"The image is too large ({image.width}x{image.height}).")
+        image.draft('RGB', (max_dimension, max_dimension))
+        n_frames = getattr(image, 'n_frames', 1)
+        loop = image.info.get('loop', 0)
+
+        frames, durations = [], []
+        kept_pixels = 0
+        for frame in ImageSequence.Iterator(image):
+            if len(frames) >= max_frames or kept_pixels >= max_pixels:
+                break
+            durations.append(frame.info.get('duration') or DEFAULT_FRAME_DURATION)
+            # Frames come composited; RGBA keeps transparency for both outputs
+            frame = frame.convert('RGBA')
+            frame.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            frames.append(frame)
+            kept_pixels += frame.width * frame.height
+    return frames, durations, loop, len(frames) < n_frames
+
+
+def encode(frames, durations, loop, image_format, **options):
+    """
+    Write frames as one (possibly animated) image into a temporary file.
+    """
+    output = tempfile.TemporaryFile()
+    animated = len(frames) > 1
+    if animated:
+        options.update(save_all=True, append_images=frames[1:], duration=durations, loop=loop)
+    frames[0].save(output, format=image_format, **options)
+    output.seek(0)
+    return output
+
+
+def transcode(media):
+    """
+    Convert media.source_file into gif_file and webp_file. Does not save media.
+    """
+    with media.source_file.open('rb') as source:
+        frames, durations, loop, truncated = load_frames(source)
+    stem = os.path.splitext(os.path.basename(media.source_file.name))[0]
+
+    with encode(frames, durations, loop, 'GIF', disposal=2) as gif:
+        media.gif_file.save(f"{stem}.gif", File(gif), save=False)
+    with encode(frames, durations, loop, 'WEBP', quality=_setting('MEDIA_WEBP_QUALITY', DEFAULT_WEBP_QUALITY),
+                method=4) as webp:
+        media.webp_file.save(f"{stem}.webp", File(webp), save=False)
+    return f"Animation truncated to {len(frames)} frames." if truncated else ''
+
+
+def transcode_media(media_id):
+    """
+    Runs in a worker process of the transcode pool.
+    """
+    try:
+        media = MediaStorage.objects.get(pk=media_id)
+        media.status = MediaStorage.PROCESSING
+        media.save(update_fields=['status'])
+        try:
+            media.detail = transcode(media)
+            media.status = MediaStorage.READY
+        except Exception as e:
+            logger.exception(f"Transcoding media {media_id} failed")
+            media.status = MediaStorage.FAILED
+            media.detail = str(e)
+        media.save(update_fields=['gif_file', 'webp_file', 'status', 'detail'])
+    finally:
+        connection.close()
+
+
+def _transcode_done(media_id, future):
+    # A worker that died (e.g. killed for memory) never updated the row
+    error = future.exception()
+    if error is None:
+        return
+    logger.error(f"Transcoding media {media_id} did not finish: {error!r}")
+    if isinstance(error, BrokenProcessPool):
+        discard_process_pool(POOL_NAME)
+    try:
+        MediaStorage.objects.filter(pk=media_id).exclude(status=MediaStorage.READY).update(
+            status=MediaStorage.FAILED, detail=str(error) or error.__class__.__name__,
+        )
+    finally:
+        connection.close()
+
+
+def schedule_transcode(media):
+    """
+    Queue media for conversion in the transcode process pool.
+    """
+    workers = _setting('MEDIA_TRANSCODE_WORKERS', DEFAULT_TRANSCODE_WORKERS)
+    try:
+        future = get_process_pool(POOL_NAME, workers).submit(transcode_media, media.id)
+    except BrokenProcessPool:
+        discard_process_pool(POOL_NAME)
+        future = get_process_pool(POOL_NAME, workers).submit(transcode_media, media.id)
+    future.add_done_callback(lambda done: _transcode_done(media.id, done))
+    return future
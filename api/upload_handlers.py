@@ -0,0 +1,74 @@
+import hashlib
+
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+
+from api.stl import ZIP_MAGIC, check_stl_archive
+
+# Room for the multipart boundaries and the other form fields
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class ExaminationZipUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams the examination ZIP to a temporary file while hashing it, and
+    stops reading the request as soon as it is known to be oversized or not
+    a ZIP. Once complete, the central directory is checked for the expected
+    STL members. Rejections are kept in error/error_status for the view.
+    """
+
+    field_name = 'download'
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_bytes = settings.EXAMINATION_UPLOAD_MAX_BYTES
+        self.error = None
+        self.error_status = 400
+        self.checking = False
+
+    def reject(self, message, error_status=400):
+        self.error = message
+        self.error_status = error_status
+        raise StopUpload(connection_reset=True)
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # Known too large from Content-Length, refuse when the file part starts
+        if content_length and content_length > self.max_bytes + MULTIPART_OVERHEAD:
+            self.error = "The upload is too large."
+            self.error_status = 413
+        return super().handle_raw_input(input_data, META, content_length, boundary, encoding)
+
+    def new_file(self, field_name, *args, **kwargs):
+        self.checking = field_name == self.field_name
+        if self.checking and self.error:
+            raise StopUpload(connection_reset=True)
+        super().new_file(field_name, *args, **kwargs)
+        self.digest = hashlib.sha256()
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.checking:
+            self.received += len(raw_data)
+            if self.received > self.max_bytes:
+                self.file.close()
+                self.reject("The upload is too large.", 413)
+            if start == 0 and not raw_data.startswith(ZIP_MAGIC):
+                self.file.close()
+                self.reject("Only ZIP files are accepted for upload.")
+            self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if not self.checking:
+            return file
+
+        try:
+            file.stl_members = check_stl_archive(file)
+        except ValueError as e:
+            self.error = str(e)
+            file.close()
+            return None
+        file.seek(0)
+        file.content_hash = self.digest.hexdigest()
+        return file
@@ -0,0 +1,124 @@
+import hashlib
+import os
+from datetime import timedelta
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.http.request import UnreadablePostError
+from django.utils import timezone
+
+from api.models import UploadSession
+
+# tus-style protocol headers
+UPLOAD_OFFSET = 'Upload-Offset'
+UPLOAD_LENGTH = 'Upload-Length'
+CHUNK_CONTENT_TYPE = 'application/offset+octet-stream'
+
+CHUNK_SIZE = 64 * 1024
+
+
+class OffsetMismatch(Exception):
+    pass
+
+
+class ChunkTooLarge(Exception):
+    pass
+
+
+class UploadLocked(Exception):
+    pass
+
+
+class ChunkedUploadedFile(UploadedFile):
+    """
+    A finished upload session seen as an uploaded file. Exposing
+    temporary_file_path() lets FileSystemStorage move it into place
+    instead of copying it.
+    """
+
+    def __init__(self, session):
+        super().__init__(
+            file=open(session.path, 'rb'),
+            name=session.filename,
+            content_type='application/zip',
+            size=session.size,
+        )
+        self._path = session.path
+        self.content_hash = self._hash()
+
+    def _hash(self):
+        digest = hashlib.sha256()
+        for chunk in self.chunks():
+            digest.update(chunk)
+        self.seek(0)
+        return digest.hexdigest()
+
+    def temporary_file_path(self):
+        return self._path
+
+
+def create_upload_session(customer, filename, size, metadata):
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    session = UploadSession.objects.create(customer=customer, filename=filename, size=size, metadata=metadata)
+    open(session.path, 'wb').close()
+    return session
+
+
+def append_chunk(session, offset, stream, content_length):
+    """
+    Append the request body to the session's partial file at offset.
+    Bytes received before a dropped connection are kept, so the client can
+    resume from the offset that is returned.
+    """
+    with open(session.path, 'r+b') as fh:
+        if fcntl:
+            try:
+                fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise UploadLocked()
+        # Another request may have appended since the session was loaded
+        session.refresh_from_db(fields=['offset'])
+        if offset != session.offset:
+            raise OffsetMismatch(session.offset)
+        if content_length is not None and session.offset + content_length > session.size:
+            raise ChunkTooLarge(session.size - session.offset)
+        # An empty PATCH has no body stream at all; nothing to append
+        if stream is None or content_length == 0:
+            return session.offset
+
+        remaining = session.size - session.offset
+        # Drop bytes of an earlier write that never got recorded
+        fh.truncate(session.offset)
+        fh.seek(session.offset)
+        while remaining > 0:
+            try:
+                chunk = stream.read(min(CHUNK_SIZE, remaining))
+            except (UnreadablePostError, OSError):
+                # Client went away, keep what arrived
+                break
+            if not chunk:
+                break
+            fh.write(chunk)
+            remaining -= len(chunk)
+        session.offset = fh.tell()
+        session.save(update_fields=['offset', 'updated_at'])
+    return session.offset
+
+
+def is_complete(session):
+    return session.offset == session.size
+
+
+def purge_expired_sessions(expiry=None):
+    if expiry is None:
+        expiry = getattr(settings, 'CHUNKED_UPLOAD_EXPIRY', timedelta(days=2))
+    count = 0
+    for session in UploadSession.objects.filter(updated_at__lt=timezone.now() - expiry):
+        session.delete()
+        count += 1
+    return count
@@ -1,23 +1,23 @@
 from django.conf import settings
-from django.conf.urls.static import static
-from django.urls import path
-from . import views
-from rest_framework_simplejwt.views import TokenRefreshView
+from django.urls import path, re_path
+from . import media, views
 
 urlpatterns = [
     # JWT Authentication
     path('token/', views.MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', views.MyTokenRefreshView.as_view(), name='token_refresh'),
 
     # User Registration and Detail Management
     path('register/', views.RegisterView.as_view(), name='auth_register'),
     path('users/', views.userListView, name='user_list'),
+    path('users/provision/', views.provisionUsers, name='provision_users'),
     path('users/<int:user_id>/', views.userDetailView, name='user_detail'),
     path('users/<int:user_id>/delete/', views.deleteUser, name='delete_user'),
     path('users/<int:user_id>/update/', views.updateUserView, name='user_update'),
 
     # Log Management
     path('logs/', views.createLog, name='create_log'),
+    path('logs/bulk/', views.createLogsBulk, name='create_logs_bulk'),
     path('logs/all/', views.allLogsView, name='all_logs'),
     path('logs/<int:log_id>/', views.getLogById, name='get_log_by_id'),
     
@@ -30,12 +30,17 @@ urlpatterns = [
     # App Versioning
     path('upload-version/', views.uploadVersion, name='upload_version'),
     path('latest-version/', views.getLatestVersion, name='latest_version'),
+    path('versions/<int:version_id>/delta/', views.getVersionDelta, name='version_delta'),
 
     # Examination Management
     path('examinations/', views.listExaminations, name='list_examinations'),
     path('examinations/create/', views.createExamination, name='create_examination'),  # Ensure file upload is handled here
+    path('examinations/uploads/', views.createUploadSession, name='create_upload_session'),
+    path('examinations/uploads/<uuid:session_id>/', views.uploadSessionView, name='upload_session'),
+    path('examinations/uploads/<uuid:session_id>/finalize/', views.finalizeUploadSession, name='finalize_upload_session'),
     path('examinations/<int:examination_id>/', views.getExaminationById, name='get_examination_by_id'),
     path('examinations/<int:examination_id>/fetch-stl/', views.fetchExaminationAndSTL, name='fetch_examination_and_stl'),
+    path('examinations/<int:examination_id>/geometry/', views.examinationGeometry, name='examination_geometry'),
 
     # Ticket Management
     path('tickets/', views.allTicketsView, name='all_tickets'),
@@ -53,6 +58,17 @@ urlpatterns = [
     path('media/upload/', views.uploadMedia, name='upload_media'),
     path('media/', views.listMedia, name='list_media'),
 
+    # Bug and log counts from the rollup tables
+    path('analytics/bugs/', views.bugAnalytics, name='bug_analytics'),
+    path('analytics/logs/', views.logAnalytics, name='log_analytics'),
+
     # Get job records
     path('jobrec/', views.jobRec, name='job_records'),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+]
+
+# Uploaded and generated media (ranges, conditional requests, sidecars).
+# Unauthenticated, so like static() only in development.
+if settings.DEBUG:
+    urlpatterns += [
+        re_path(r'^media/(?P<path>.*)$', media.serve_media, name='api_media'),
+    ]
\ No newline at end of file
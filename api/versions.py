@@ -0,0 +1,47 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from api.models import AppVersion
+from api.serializer import AppVersionSerializer
+
+MANIFEST_CACHE_KEY = 'app_version:latest_manifest'
+
+# The manifest of "no versions yet", cached like any other
+NO_VERSION = {'body': None, 'etag': None}
+
+
+def manifest_cache_ttl():
+    # Bounds how long another process may serve an old manifest when the
+    # cache isn't shared; None keeps it until the next upload
+    return getattr(settings, 'LATEST_VERSION_CACHE_TTL', 300)
+
+
+def build_latest_manifest():
+    """
+    Render the latest AppVersion once: the JSON body getLatestVersion sends
+    and a strong ETag derived from it.
+    """
+    try:
+        latest = AppVersion.objects.latest('created_at')
+    except AppVersion.DoesNotExist:
+        return NO_VERSION
+    body = JSONRenderer().render(AppVersionSerializer(latest).data)
+    return {'body': body, 'etag': quote_etag(hashlib.sha1(body).hexdigest())}
+
+
+def get_latest_manifest():
+    manifest = cache.get(MANIFEST_CACHE_KEY)
+    if manifest is None:
+        manifest = build_latest_manifest()
+        cache.set(MANIFEST_CACHE_KEY, manifest, manifest_cache_ttl())
+    return manifest
+
+
+def invalidate_latest_manifest(sender, **kwargs):
+    # After commit, so a request in between cannot cache the old manifest again
+    transaction.on_commit(lambda: cache.delete(MANIFEST_CACHE_KEY))
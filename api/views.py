@@ -1,44 +1,73 @@
 
 # imports
 
-import os
-import io
-import zipfile
-
-from PIL import Image
-from io import BytesIO
-from django.core.files.base import ContentFile
 
 
-
-import requests
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
 from django.conf import settings  # Add this to manage file paths
-from api.models import User, Bug, Log, AppVersion, Ticket, Examination, NameStorage , MediaStorage , JobRec
+from api.models import User, Bug, Log, AppVersion, AppVersionDelta, Ticket, Examination, NameStorage , MediaStorage , JobRec , UploadSession , BugCluster
+from api.mesh import QMESH_MEDIA_TYPE
+from api.parsers import CSVParser, InvalidRecord, NDJSONParser
+from api.provisioning import provision_users
+from api.search import matches_query, search, search_codes
+from api.archive import TieredRows, archive_reaches, get_archived
+from api.transcode import check_image, schedule_transcode
+from api.versions import get_latest_manifest
+from api.writebehind import submit as submit_write, write_behind_enabled
+from api.pagination import KeysetPageNumberPagination
+from api.counts import invalidate_counts
+from api.deltas import schedule_delta_build
+from api.analytics import record_created, rollup_series
+from api.upload_handlers import ExaminationZipUploadHandler
+from api.uploads import (
+    CHUNK_CONTENT_TYPE,
+    UPLOAD_LENGTH,
+    UPLOAD_OFFSET,
+    ChunkedUploadedFile,
+    ChunkTooLarge,
+    OffsetMismatch,
+    UploadLocked,
+    append_chunk,
+    create_upload_session,
+    is_complete,
+)
+from api.stl import DEFAULT_OUTPUT, FULL_LOD, OUTPUT_FORMATS, STL_LOD_LEVELS, get_cached_stl_files, get_stl_geometry, schedule_stl_extraction
 import logging
 from api.serializer import (
     MyTokenObtainPairSerializer,
+    MyTokenRefreshSerializer,
     RegisterSerializer,
     UserSerializer,
     BugSerializer,
     LogSerializer,
     AppVersionSerializer,
+    AppVersionDeltaSerializer,
     TicketSerializer,
     ExaminationSerializer,
     NameStorageSerializer,
     MediaStorageSerializer,
-    JobRecSerializer
+    JobRecSerializer,
+    STLGeometrySerializer,
+    BugClusterSerializer,
+    BugSearchSerializer,
+    LogSearchSerializer,
+    TicketSearchSerializer
 )
 
-from rest_framework.pagination import PageNumberPagination
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework import generics
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import status
-from django.db.models import Q
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, timedelta
+import zipfile
 
 
 
@@ -46,6 +75,9 @@ from django.db.models import Q
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
+class MyTokenRefreshView(TokenRefreshView):
+    serializer_class = MyTokenRefreshSerializer
+
 class RegisterView(generics.CreateAPIView):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
@@ -76,10 +108,11 @@ def testEndPoint(request):
 
 #users Endpoints
 
-class UserPagination(PageNumberPagination):
+class UserPagination(KeysetPageNumberPagination):
     page_size = 9  
     page_size_query_param = 'page_size'
     max_page_size = 100 
+    cursor_ordering = ('date_joined', 'id')
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -88,17 +121,44 @@ def userListView(request):
     users = User.objects.all()
 
     if query:
-        users = users.filter(
-            Q(username__icontains=query) |    
-            Q(email__icontains=query) |       
-            Q(serial_number__icontains=query) 
-        )
+        users = search_codes(users, query)
 
     paginator = UserPagination()
     paginated_users = paginator.paginate_queryset(users, request)
     serializer = UserSerializer(paginated_users, many=True)
     return paginator.get_paginated_response(serializer.data)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([JSONParser, NDJSONParser, CSVParser])
+def provisionUsers(request):
+    if not request.user.is_superuser:
+        return Response({'error': 'You do not have permission to provision users.'}, status=status.HTTP_403_FORBIDDEN)
+
+    records = request.data
+    if isinstance(records, dict):
+        records = records.get('users')
+    if not isinstance(records, list):
+        return Response({"error": "Send a JSON array, {\"users\": [...]}, NDJSON or CSV."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(records) > settings.USER_PROVISION_MAX_ITEMS:
+        return Response({"error": f"At most {settings.USER_PROVISION_MAX_ITEMS} users per request."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    dry_run = request.GET.get('dry_run') in ('1', 'true')
+    try:
+        created, errors = provision_users(records, dry_run=dry_run)
+    except IntegrityError:
+        # Another request took one of the values since they were checked
+        return Response({"error": "Some users were created concurrently, retry the batch."}, status=status.HTTP_409_CONFLICT)
+
+    response_status = status.HTTP_201_CREATED if created or not errors else status.HTTP_400_BAD_REQUEST
+    if dry_run:
+        response_status = status.HTTP_200_OK if not errors else status.HTTP_400_BAD_REQUEST
+    return Response({
+        "created": len(created),
+        "ids": [user.id for user in created if user.id is not None],
+        "errors": errors,
+    }, status=response_status)
+
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 def updateUserView(request, user_id):
@@ -157,10 +217,17 @@ def userDetailView(request, user_id):
         user.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+def _write_behind(instance, serializer):
+    # Acknowledge now, the write-behind writer saves it with the next batch
+    if not submit_write(instance):
+        return Response({"error": "Too many pending writes, retry later."},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '1'})
+    return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
 # Bug Endpoints
 
 
-class BugPagination(PageNumberPagination):
+class BugPagination(KeysetPageNumberPagination):
     page_size = 10  
     page_size_query_param = 'page_size'
     max_page_size = 100 
@@ -171,6 +238,8 @@ def createBug(request):
     serializer = BugSerializer(data=request.data)
 
     if serializer.is_valid():
+        if write_behind_enabled():
+            return _write_behind(Bug(user=request.user, **serializer.validated_data), serializer)
         bug = serializer.save(user=request.user)  
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -185,27 +254,56 @@ def userBugs(request):
     serializer = BugSerializer(paginated_bugs, many=True)
     return paginator.get_paginated_response(serializer.data)
 
-class AllBugsPagination(PageNumberPagination):
+class AllBugsPagination(KeysetPageNumberPagination):
     page_size = 10  
     page_size_query_param = 'page_size' 
     max_page_size = 100 
 
+class BugClusterPagination(KeysetPageNumberPagination):
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_ordering = ('first_seen', 'id')
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def allBugsView(request):
     query = request.GET.get('search', None)
     bugs = Bug.objects.all()
+    serializer_class = BugSerializer
+
+    bounds, error = _date_range_params(request, _parse_timestamp, None, None)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    start, end = bounds
+    if start:
+        bugs = bugs.filter(created_at__gte=start)
+    if end:
+        bugs = bugs.filter(created_at__lte=end)
 
     if query:
-        bugs = bugs.filter(
-            Q(hardwareCode__icontains=query) |  
-            Q(softwareCode__icontains=query) |   
-            Q(bugTxt__icontains=query)            
-        )
+        bugs = search(bugs, query)
+        serializer_class = BugSearchSerializer
+
+    # ?group=cluster returns one row per near-duplicate cluster instead of every report
+    if request.GET.get('group') == 'cluster':
+        clusters = BugCluster.objects.order_by('-last_seen', '-id')
+        if query:
+            # Evaluated first: the rank lookups name the table and cannot be nested as a subquery
+            cluster_ids = set(bugs.order_by().values_list('cluster_id', flat=True).distinct())
+            clusters = clusters.filter(id__in=cluster_ids)
+        paginator = BugClusterPagination()
+        paginated_clusters = paginator.paginate_queryset(clusters, request)
+        serializer = BugClusterSerializer(paginated_clusters, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    # Like allLogsView, ranges reaching back past the retention period include archived bugs
+    if archive_reaches(Bug, start, end):
+        bugs = TieredRows(bugs, start, end, matches=(lambda bug: matches_query(bug, query)) if query else None)
 
     paginator = AllBugsPagination()
     paginated_bugs = paginator.paginate_queryset(bugs, request)
-    serializer = BugSerializer(paginated_bugs, many=True)
+    serializer = serializer_class(paginated_bugs, many=True)
     return paginator.get_paginated_response(serializer.data)
 
 @api_view(['GET'])
@@ -216,11 +314,41 @@ def getBugById(request, bug_id):
         serializer = BugSerializer(bug)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Bug.DoesNotExist:
+        bug = get_archived(Bug, bug_id)
+        if bug is not None:
+            return Response(BugSerializer(bug).data, status=status.HTTP_200_OK)
         return Response({'error': 'Bug not found.'}, status=status.HTTP_404_NOT_FOUND)    
 
+def _date_range_params(request, parse, default_start, default_end):
+    bounds = []
+    for param, default in (('from', default_start), ('to', default_end)):
+        value = request.GET.get(param)
+        if not value:
+            bounds.append(default)
+            continue
+        try:
+            parsed = parse(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            return None, f"Invalid '{param}' value."
+        bounds.append(parsed)
+    return bounds, None
+
+def _parse_timestamp(value):
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        parsed = datetime.combine(day, datetime.min.time())
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
 # log Endpoints
 
-class LogPagination(PageNumberPagination):
+class LogPagination(KeysetPageNumberPagination):
     page_size = 10  
     page_size_query_param = 'page_size'
     max_page_size = 100 
@@ -231,27 +359,81 @@ def createLog(request):
     serializer = LogSerializer(data=request.data)
 
     if serializer.is_valid():
-        log = serializer.save()  
+        if write_behind_enabled():
+            return _write_behind(Log(user=request.user, **serializer.validated_data), serializer)
+        log = serializer.save(user=request.user)  
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@parser_classes([JSONParser, NDJSONParser])
+def createLogsBulk(request):
+    records = request.data
+    if isinstance(records, dict):
+        records = records.get('logs')
+    if not isinstance(records, list):
+        return Response({"error": "Send a JSON array, {\"logs\": [...]} or NDJSON."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(records) > settings.LOG_BULK_MAX_ITEMS:
+        return Response({"error": f"At most {settings.LOG_BULK_MAX_ITEMS} logs per request."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    logs = []
+    errors = []
+    for index, record in enumerate(records):
+        if isinstance(record, InvalidRecord):
+            errors.append({"index": index, "errors": {"non_field_errors": [record.error]}})
+            continue
+        if not isinstance(record, dict):
+            errors.append({"index": index, "errors": {"non_field_errors": ["Each log must be an object."]}})
+            continue
+        serializer = LogSerializer(data=record)
+        if serializer.is_valid():
+            logs.append(Log(user=request.user, **serializer.validated_data))
+        else:
+            errors.append({"index": index, "errors": serializer.errors})
+
+    # One transaction and a few INSERTs for the whole batch
+    with transaction.atomic():
+        created = Log.objects.bulk_create(logs, batch_size=500)
+        # bulk_create sends no post_save
+        record_created(Log, created)
+    invalidate_counts(Log)
+
+    response_status = status.HTTP_201_CREATED if created or not errors else status.HTTP_400_BAD_REQUEST
+    return Response({
+        "created": len(created),
+        "ids": [log.id for log in created if log.id is not None],
+        "errors": errors,
+    }, status=response_status)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])  
 def allLogsView(request):
     query = request.GET.get('search', None)
     logs = Log.objects.all()  
+    serializer_class = LogSerializer
+
+    bounds, error = _date_range_params(request, _parse_timestamp, None, None)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+    start, end = bounds
+    if start:
+        logs = logs.filter(created_at__gte=start)
+    if end:
+        logs = logs.filter(created_at__lte=end)
 
     if query:
-        logs = logs.filter(
-            Q(hardwareCode__icontains=query) |  
-            Q(softwareCode__icontains=query) |   
-            Q(logTxt__icontains=query)            
-        )
+        logs = search(logs, query)
+        serializer_class = LogSearchSerializer
+
+    # Ranges reaching back past the retention period include archived logs
+    if archive_reaches(Log, start, end):
+        logs = TieredRows(logs, start, end, matches=(lambda log: matches_query(log, query)) if query else None)
 
     paginator = LogPagination()  
     paginated_logs = paginator.paginate_queryset(logs, request)  
-    serializer = LogSerializer(paginated_logs, many=True)
+    serializer = serializer_class(paginated_logs, many=True)
     return paginator.get_paginated_response(serializer.data)
 
 
@@ -263,6 +445,9 @@ def getLogById(request, log_id):
         serializer = LogSerializer(log)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Log.DoesNotExist:
+        log = get_archived(Log, log_id)
+        if log is not None:
+            return Response(LogSerializer(log).data, status=status.HTTP_200_OK)
         return Response({'error': 'Log not found.'}, status=status.HTTP_404_NOT_FOUND)    
 
 #Version Endpoints    
@@ -272,20 +457,52 @@ def getLogById(request, log_id):
 def uploadVersion(request):
     serializer = AppVersionSerializer(data=request.data)
     if serializer.is_valid():
-        serializer.save()  
+        version = serializer.save()
+        # Patches from the previous versions, so devices can skip the full download
+        transaction.on_commit(lambda: schedule_delta_build(version))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@api_view(['GET'])
+def getVersionDelta(request, version_id):
+    field = request.GET.get('file', 'file')
+    if field not in AppVersionDelta.FILE_FIELDS:
+        return Response({'error': f"file must be one of {', '.join(AppVersionDelta.FILE_FIELDS)}."}, status=status.HTTP_400_BAD_REQUEST)
+
+    deltas = AppVersionDelta.objects.filter(to_version_id=version_id, field=field)
+    from_id = request.GET.get('from')
+    from_number = request.GET.get('from_version')
+    if from_id:
+        if not from_id.isdigit():
+            return Response({'error': 'from must be a version id.'}, status=status.HTTP_400_BAD_REQUEST)
+        deltas = deltas.filter(from_version_id=from_id)
+    elif from_number:
+        deltas = deltas.filter(from_version__version_number=from_number)
+    else:
+        return Response({'error': 'Pass from (version id) or from_version (version number).'}, status=status.HTTP_400_BAD_REQUEST)
+
+    delta = deltas.order_by('-from_version__created_at').first()
+    if delta is None:
+        # Not built (yet), or not worth it: the device downloads the full file
+        return Response({'error': 'No delta available for this update.'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(AppVersionDeltaSerializer(delta).data)
+
 @api_view(['GET'])
 def getLatestVersion(request):
-    try:
-        latest_version = AppVersion.objects.latest('created_at')  
-        serializer = AppVersionSerializer(latest_version)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-    except AppVersion.DoesNotExist:
+    # Served from the manifest cached until the next upload; devices that
+    # already have it get a 304
+    manifest = get_latest_manifest()
+    if manifest['body'] is None:
         return Response({'error': 'No versions available.'}, status=status.HTTP_404_NOT_FOUND)
 
-class AppVersionPagination(PageNumberPagination):
+    response = get_conditional_response(request, etag=manifest['etag'])
+    if response is None:
+        response = HttpResponse(manifest['body'], content_type='application/json')
+    response['ETag'] = manifest['etag']
+    response['Cache-Control'] = f"public, max-age={settings.LATEST_VERSION_MAX_AGE}, must-revalidate"
+    return response
+
+class AppVersionPagination(KeysetPageNumberPagination):
     page_size = 10  
     page_size_query_param = 'page_size'
     max_page_size = 100
@@ -301,7 +518,7 @@ def allVersionsView(request):
 
 #Tickets Endpoints
 
-class TicketPagination(PageNumberPagination):
+class TicketPagination(KeysetPageNumberPagination):
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
@@ -322,16 +539,15 @@ def createTicket(request):
 def allTicketsView(request):
     query = request.GET.get('search', None)
     tickets = Ticket.objects.all() 
+    serializer_class = TicketSerializer
 
     if query:
-        tickets = tickets.filter(
-            Q(title__icontains=query) |         
-            Q(body__icontains=query)            
-        )
+        tickets = search(tickets, query)
+        serializer_class = TicketSearchSerializer
 
     paginator = TicketPagination()
     paginated_tickets = paginator.paginate_queryset(tickets, request)
-    serializer = TicketSerializer(paginated_tickets, many=True)
+    serializer = serializer_class(paginated_tickets, many=True)
     return paginator.get_paginated_response(serializer.data)
 
 
@@ -347,7 +563,7 @@ def getTicketById(request, ticket_id):
 
 #Examination Endpoints    
 
-class ExaminationPagination(PageNumberPagination):
+class ExaminationPagination(KeysetPageNumberPagination):
     page_size = 10  
     page_size_query_param = 'page_size'
     max_page_size = 100
@@ -356,8 +572,15 @@ class ExaminationPagination(PageNumberPagination):
 @permission_classes([IsAuthenticated])
 def createExamination(request):
 
+    # Hash and check the ZIP while it streams in, must be set before request.data
+    upload_handler = ExaminationZipUploadHandler(request)
+    request.upload_handlers = [upload_handler]
+
     logger.info(f"Request data: {request.data}")
 
+    if upload_handler.error:
+        return Response({"error": upload_handler.error}, status=upload_handler.error_status)
+
     if 'download' not in request.FILES or not request.FILES['download'].name.endswith('.zip'):
         return Response({"error": "Only ZIP files are accepted for upload."}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -370,12 +593,135 @@ def createExamination(request):
 
         logger.info(f"Examination created successfully: {examination.design_title}")
 
+        # Extract the STL files in the background so fetch-stl finds them ready
+        transaction.on_commit(lambda: schedule_stl_extraction(examination))
+
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     logger.error(f"Error creating examination: {serializer.errors}")
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# Resumable examination uploads (tus-style: create, PATCH chunks, finalize)
+
+EXAMINATION_METADATA_FIELDS = ['dataset', 'design_title', 'last_uid', 'high_heel', 'has_shoe', 'single_foot']
+
+def upload_session_headers(response, session):
+    response[UPLOAD_OFFSET] = str(session.offset)
+    response[UPLOAD_LENGTH] = str(session.size)
+    response['Cache-Control'] = 'no-store'
+    return response
+
+def upload_session_data(request, session):
+    return {
+        'id': str(session.id),
+        'filename': session.filename,
+        'size': session.size,
+        'offset': session.offset,
+        'upload_url': request.build_absolute_uri(f"/api/examinations/uploads/{session.id}/"),
+    }
+
+def get_upload_session(request, session_id):
+    try:
+        session = UploadSession.objects.get(id=session_id)
+    except UploadSession.DoesNotExist:
+        return None, Response({'error': 'Upload session not found.'}, status=status.HTTP_404_NOT_FOUND)
+    if session.customer != request.user and not request.user.is_superuser:
+        return None, Response({'error': 'You do not have permission to access this upload.'}, status=status.HTTP_403_FORBIDDEN)
+    return session, None
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def createUploadSession(request):
+    filename = request.data.get('filename', '')
+    size = request.data.get('size', request.META.get('HTTP_UPLOAD_LENGTH'))
+
+    if not isinstance(filename, str) or not filename.endswith('.zip'):
+        return Response({"error": "Only ZIP files are accepted for upload."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        return Response({"error": "A positive upload size is required."}, status=status.HTTP_400_BAD_REQUEST)
+    if size <= 0:
+        return Response({"error": "A positive upload size is required."}, status=status.HTTP_400_BAD_REQUEST)
+    if size > settings.EXAMINATION_UPLOAD_MAX_BYTES:
+        return Response({"error": "The upload is too large."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    # Check the examination fields now rather than after the whole upload
+    metadata = {name: request.data[name] for name in EXAMINATION_METADATA_FIELDS if name in request.data}
+    serializer = ExaminationSerializer(data=metadata)
+    serializer.is_valid()
+    # All of them, finalize has nothing but these; only the file is still missing
+    errors = {name: error for name, error in serializer.errors.items() if name != 'download'}
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    session = create_upload_session(request.user, filename, size, metadata)
+    data = upload_session_data(request, session)
+    response = Response(data, status=status.HTTP_201_CREATED)
+    response['Location'] = data['upload_url']
+    return upload_session_headers(response, session)
+
+@api_view(['GET', 'HEAD', 'PATCH', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def uploadSessionView(request, session_id):
+    session, error = get_upload_session(request, session_id)
+    if error:
+        return error
+
+    if request.method in ('GET', 'HEAD'):
+        return upload_session_headers(Response(upload_session_data(request, session)), session)
+
+    elif request.method == 'DELETE':
+        session.delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    if request.content_type != CHUNK_CONTENT_TYPE:
+        return Response({"error": f"Chunks must be sent as {CHUNK_CONTENT_TYPE}."}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+    try:
+        offset = int(request.META.get('HTTP_UPLOAD_OFFSET', ''))
+        content_length = int(request.META['CONTENT_LENGTH']) if request.META.get('CONTENT_LENGTH') else None
+    except ValueError:
+        return Response({"error": "Upload-Offset header is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        append_chunk(session, offset, request.stream, content_length)
+    except OffsetMismatch:
+        return upload_session_headers(Response({"error": "Upload-Offset does not match the current offset."}, status=status.HTTP_409_CONFLICT), session)
+    except ChunkTooLarge:
+        return upload_session_headers(Response({"error": "Chunk exceeds the declared upload size."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE), session)
+    except UploadLocked:
+        return upload_session_headers(Response({"error": "Another chunk is being written."}, status=status.HTTP_423_LOCKED), session)
+
+    return upload_session_headers(Response(status=status.HTTP_204_NO_CONTENT), session)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finalizeUploadSession(request, session_id):
+    session, error = get_upload_session(request, session_id)
+    if error:
+        return error
+
+    if not is_complete(session):
+        return upload_session_headers(Response({"error": "The upload is not complete."}, status=status.HTTP_409_CONFLICT), session)
+
+    upload = ChunkedUploadedFile(session)
+    try:
+        serializer = ExaminationSerializer(data={**session.metadata, 'download': upload})
+        if not serializer.is_valid():
+            logger.error(f"Error creating examination: {serializer.errors}")
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        examination = serializer.save(customer=session.customer)
+    finally:
+        upload.close()
+
+    logger.info(f"Examination created successfully: {examination.design_title}")
+    session.delete()
+
+    transaction.on_commit(lambda: schedule_stl_extraction(examination))
+    return Response(serializer.data, status=status.HTTP_201_CREATED)
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def listExaminations(request):
@@ -403,69 +749,70 @@ logger = logging.getLogger(__name__)
 def fetchExaminationAndSTL(request, examination_id):
     try:
         examination = Examination.objects.get(id=examination_id)
-        
-
-        download_path = examination.download.url 
-        full_download_url = f"{request.scheme}://{request.get_host()}{download_path}"
-
-        logger.info(f"Attempting to download file from:{full_download_url}")
-
-        response = requests.get(full_download_url)
-
-        logger.info(f"Response status code: {response.status_code}")
-
-        if response.status_code != 200:
-            return Response({"error": "Failed to download the file.", "status_code": response.status_code}, status=response.status_code)
-
-        zip_content = response.content
-        stl_filenames = [
-            
-            'Left_InternalStructure_Hollow.STL',
-            'Left_FootShoe.STL',
-            'Left_Skeleton.STL',
-            'Left_Insole_Floor.STL',
-            'Left_Insole_Roof.STL',
-            'Right_InternalStructure_Hollow.STL',
-            'Right_FootShoe.STL',
-            'Right_Skeleton.STL',
-            'Right_Insole_Floor.STL',
-            'Right_Insole_Roof.STL',
-        
-        ]
 
         # Get the 'filenames' parameter from the query string
         requested_files = request.GET.getlist('filenames')
 
-        saved_files = []
-        with zipfile.ZipFile(io.BytesIO(zip_content)) as z:
-            # Filter filenames if 'filenames' parameter is provided
-            for stl_filename in stl_filenames:
-                if requested_files and stl_filename not in requested_files:
-                    continue  # Skip this file if it's not in the requested files
-
-                if stl_filename in z.namelist():
-                    stl_content = z.read(stl_filename)
-                    saved_stl_path = os.path.join(settings.MEDIA_ROOT, 'stl_files', stl_filename)
-
-                    os.makedirs(os.path.dirname(saved_stl_path), exist_ok=True)
+        # Optional level of detail in percent of the original triangles
+        lod = request.GET.get('lod', str(FULL_LOD))
+        if not lod.isdigit() or int(lod) not in STL_LOD_LEVELS:
+            return Response({"error": f"lod must be one of {STL_LOD_LEVELS}."}, status=status.HTTP_400_BAD_REQUEST)
 
-                    with open(saved_stl_path, 'wb') as stl_file:
-                        stl_file.write(stl_content)
+        # Optional delivery format, 'format' itself is taken by DRF's renderer override.
+        # Clients may also list the qmesh media type next to JSON in Accept.
+        default_output = 'qmesh' if QMESH_MEDIA_TYPE in request.META.get('HTTP_ACCEPT', '') else DEFAULT_OUTPUT
+        output = request.GET.get('output', default_output)
+        if output not in OUTPUT_FORMATS:
+            return Response({"error": f"output must be one of {OUTPUT_FORMATS}."}, status=status.HTTP_400_BAD_REQUEST)
 
-                    download_url = f"{request.scheme}://{request.get_host()}/media/stl_files/{stl_filename}"
-                    saved_files.append({"filename": stl_filename, "download_link": download_url})
+        saved_files = []
+        for stl_file in get_cached_stl_files(examination, requested_files, int(lod), output):
+            saved_files.append({
+                "filename": stl_file['filename'],
+                "download_link": request.build_absolute_uri(stl_file['url']),
+                "compressed_links": {
+                    encoding: request.build_absolute_uri(url)
+                    for encoding, url in stl_file['compressed'].items()
+                },
+            })
 
         if saved_files:
-            return Response({"message": "STL files saved successfully.", "files": saved_files}, status=status.HTTP_200_OK)
+            return Response({"message": "STL files saved successfully.", "lod": int(lod), "output": output, "files": saved_files}, status=status.HTTP_200_OK)
         else:
             return Response({"error": "No STL files were found in ZIP."}, status=status.HTTP_404_NOT_FOUND)
 
     except Examination.DoesNotExist:
         return Response({"error": "Examination not found."}, status=status.HTTP_404_NOT_FOUND)
+    except FileNotFoundError:
+        return Response({"error": "Failed to open the examination file."}, status=status.HTTP_404_NOT_FOUND)
+    except zipfile.BadZipFile:
+        return Response({"error": "The examination file is not a valid ZIP archive."}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
     except Exception as e:
         logger.error(f"An error occurred: {e}")
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def examinationGeometry(request, examination_id):
+    try:
+        examination = Examination.objects.get(id=examination_id)
+    except Examination.DoesNotExist:
+        return Response({"error": "Examination not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        geometry = get_stl_geometry(examination)
+    except FileNotFoundError:
+        return Response({"error": "Failed to open the examination file."}, status=status.HTTP_404_NOT_FOUND)
+    except zipfile.BadZipFile:
+        return Response({"error": "The examination file is not a valid ZIP archive."}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+    except ValueError as e:
+        # Invalid STL members
+        return Response({"error": str(e)}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    serializer = STLGeometrySerializer(geometry, many=True)
+    return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 
@@ -493,28 +840,20 @@ def listNames(request):
 @api_view(['POST'])
 def uploadMedia(request):
     serializer = MediaStorageSerializer(data=request.data)
-    
-    if serializer.is_valid():
-        # Handle GIF conversion
-        image_file = request.FILES.get('gif_file')
 
-        # Only convert if the uploaded file is an image
+    if serializer.is_valid():
+        image_file = serializer.validated_data.pop('gif_file', None)
         if image_file:
-            # Open image using PIL
+            # Only the header is read here, conversion runs in api.transcode
             try:
-                image = Image.open(image_file)
-                gif_io = BytesIO()
-                image.save(gif_io, format='GIF')  # Convert to GIF format
-                gif_file = ContentFile(gif_io.getvalue(), name=image_file.name.split('.')[0] + '.gif')  # Create ContentFile
-
-                # Now update the serializer instance and save
-                serializer.validated_data['gif_file'] = gif_file
-
-            except Exception as e:
-                return Response({"error": "Failed to convert the image to GIF."}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Save the media storage instance
-        serializer.save()  
+                check_image(image_file)
+            except ValueError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            media = serializer.save(source_file=image_file, status=MediaStorage.PENDING)
+            transaction.on_commit(lambda: schedule_transcode(media))
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+        serializer.save(status=MediaStorage.READY)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -536,6 +875,38 @@ def jobRec(request):
         # Handle POST request here
         serializer = JobRecSerializer(data=request.data)
         if serializer.is_valid():
+            if write_behind_enabled():
+                return _write_behind(JobRec(**serializer.validated_data), serializer)
             serializer.save()
             return Response(serializer.data, status=201)
         return Response(serializer.errors, status=400)
+
+#Analytics Endpoints
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def bugAnalytics(request):
+    today = timezone.localdate()
+    bounds, error = _date_range_params(request, parse_date, today - timedelta(days=30), today)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+    group_by = request.GET.getlist('group_by')
+    if any(field not in ('hardwareCode', 'softwareCode') for field in group_by):
+        return Response({"error": "group_by must be hardwareCode or softwareCode."}, status=status.HTTP_400_BAD_REQUEST)
+    filters = {field: request.GET[field] for field in ('hardwareCode', 'softwareCode') if request.GET.get(field)}
+
+    results = rollup_series(Bug, bounds[0], bounds[1], filters, group_by)
+    return Response({"from": bounds[0], "to": bounds[1], "results": results})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def logAnalytics(request):
+    now = timezone.now()
+    bounds, error = _date_range_params(request, _parse_timestamp, now - timedelta(hours=24), now)
+    if error:
+        return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+    filters = {'hardwareCode': request.GET['hardwareCode']} if request.GET.get('hardwareCode') else {}
+    results = rollup_series(Log, bounds[0], bounds[1], filters)
+    return Response({"from": bounds[0], "to": bounds[1], "results": results})
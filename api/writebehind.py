@@ -0,0 +1,315 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+from collections import deque
+
+from django.apps import apps
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, close_old_connections, connection, transaction
+
+from api.archive import deserialize_row, serialize_row
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_FLUSH_INTERVAL = 0.5
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Kept in the journal directory; replay skips it, its name has no pid
+DEAD_LETTER_NAME = 'dead-letter.jsonl'
+
+
+def write_behind_enabled():
+    return getattr(settings, 'WRITE_BEHIND_ENABLED', False)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def to_record(instance):
+    return {'model': instance._meta.label_lower, 'fields': serialize_row(instance)}
+
+
+def from_record(record):
+    return deserialize_row(apps.get_model(record['model']), record['fields'])
+
+
+class WriteBehindBuffer:
+    """
+    Collects unsaved model instances from request threads and saves them from
+    one writer thread, many rows per transaction, so bursts of small POSTs
+    do not each wait for the SQLite write lock.
+
+    With a journal directory every accepted instance is first appended (and
+    fsynced) to <pid>.current.jsonl. A flush renames that file aside, saves
+    the batch and then deletes it, so rows accepted but not yet saved survive
+    a crash: journals of processes no longer running are replayed when the
+    writer starts. Replay is at-least-once; a crash between commit and
+    delete saves that batch twice.
+
+    Only OperationalError (e.g. the database is locked) is retried, up to
+    max_attempts flushes in a row. Rows that still fail, or fail for any
+    other reason, are logged and appended to the dead-letter journal.
+    """
+
+    def __init__(self, max_size=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, journal_dir=None, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.journal_dir = str(journal_dir) if journal_dir else None
+
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.flushing_journals = []
+        self.journal = None
+        self.rotations = 0
+        self.failed_attempts = 0
+        self.stopping = False
+        self.thread = None
+
+    # Request threads
+
+    def submit(self, instance):
+        """
+        Queue instance for saving. Returns False when the queue is full.
+        """
+        # Queued as plain records, so a failed save can be retried on fresh instances
+        record = to_record(instance)
+        with self.condition:
+            if self.stopping or len(self.pending) >= self.max_size:
+                return False
+            if self.journal_dir:
+                self._journal_append(record)
+            self.pending.append(record)
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify()
+        self._ensure_started()
+        return True
+
+    def _ensure_started(self):
+        if self.thread is not None:
+            return
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='api-write-behind', daemon=True)
+                self.thread.start()
+
+    # Journal
+
+    def _current_journal_path(self):
+        return os.path.join(self.journal_dir, f"{os.getpid()}.current.jsonl")
+
+    def _journal_append(self, record):
+        if self.journal is None:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            self.journal = open(self._current_journal_path(), 'a', encoding='utf-8')
+        self.journal.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    def _rotate_journal(self):
+        # Called with self.condition held, right after draining self.pending
+        if self.journal is None:
+            return
+        self.journal.close()
+        self.journal = None
+        self.rotations += 1
+        path = os.path.join(self.journal_dir, f"{os.getpid()}.{self.rotations}.flushing.jsonl")
+        os.replace(self._current_journal_path(), path)
+        self.flushing_journals.append(path)
+
+    def _dead_letter(self, records):
+        for record in records:
+            logger.error(f"Dead write-behind row: {json.dumps(record, separators=(',', ':'))}")
+        if not self.journal_dir:
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        with open(os.path.join(self.journal_dir, DEAD_LETTER_NAME), 'a', encoding='utf-8') as journal:
+            for record in records:
+                journal.write(json.dumps(record, separators=(',', ':')) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def replay_journals(self):
+        """
+        Save the rows of journals left behind by processes that have exited.
+        """
+        if not self.journal_dir or not os.path.isdir(self.journal_dir):
+            return 0
+        replayed = 0
+        for path in sorted(glob.glob(os.path.join(self.journal_dir, '*.jsonl'))):
+            pid = os.path.basename(path).split('.', 1)[0]
+            if not pid.isdigit() or int(pid) == os.getpid() or _pid_alive(int(pid)):
+                continue
+            # Claim it under our pid first so two starting processes don't both replay it
+            self.rotations += 1
+            claimed = os.path.join(self.journal_dir, f"{os.getpid()}.{self.rotations}.replaying.jsonl")
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            path = claimed
+            with open(path, encoding='utf-8') as journal:
+                records = []
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                        apps.get_model(record['model'])
+                    except (ValueError, KeyError, LookupError):
+                        # Torn last line of a crashed append
+                        logger.warning(f"Skipping unreadable write-behind journal line in {path}")
+                        continue
+                    records.append(record)
+            for start in range(0, len(records), self.batch_size):
+                chunk = records[start:start + self.batch_size]
+                try:
+                    self._save(chunk)
+                except OperationalError:
+                    # Left claimed under our pid, the next process replays it again
+                    raise
+                except Exception:
+                    logger.exception(f"Replaying {len(chunk)} write-behind rows failed, moving them to the dead-letter journal")
+                    self._dead_letter(chunk)
+            os.remove(path)
+            replayed += len(records)
+        if replayed:
+            logger.info(f"Replayed {replayed} write-behind rows from journals")
+        return replayed
+
+    # Writer thread
+
+    def _run(self):
+        try:
+            self.replay_journals()
+        except Exception:
+            logger.exception("Replaying write-behind journals failed")
+        while True:
+            with self.condition:
+                if not self.stopping and len(self.pending) < self.batch_size:
+                    self.condition.wait(self.flush_interval)
+                stopping = self.stopping
+            self.flush()
+            if stopping:
+                break
+        connection.close()
+
+    def flush(self):
+        """
+        Save everything queued so far. Rows that fail with OperationalError
+        stay queued for the next flush, until max_attempts flushes in a row
+        have failed.
+        """
+        with self.flush_lock:
+            with self.condition:
+                if not self.pending:
+                    return 0
+                batch = list(self.pending)
+                self.pending.clear()
+                if self.journal_dir:
+                    self._rotate_journal()
+
+            close_old_connections()
+            for start in range(0, len(batch), self.batch_size):
+                try:
+                    self._save(batch[start:start + self.batch_size])
+                except Exception as error:
+                    # Rows the per-row fallback already committed must not be saved again
+                    done = start + getattr(error, 'saved', 0)
+                    chunk = batch[done:start + self.batch_size]
+                    if isinstance(error, OperationalError):
+                        self.failed_attempts += 1
+                        if self.failed_attempts < self.max_attempts:
+                            unsaved = batch[done:]
+                            logger.exception(f"Write-behind flush of {len(unsaved)} rows failed "
+                                             f"(attempt {self.failed_attempts} of {self.max_attempts}), will retry")
+                            with self.condition:
+                                self.pending.extendleft(reversed(unsaved))
+                            return done
+                        logger.exception(f"Write-behind flush of {len(chunk)} rows failed {self.failed_attempts} times, "
+                                         f"moving them to the dead-letter journal")
+                    else:
+                        logger.exception(f"Write-behind flush of {len(chunk)} rows failed, moving them to the dead-letter journal")
+                    self._dead_letter(chunk)
+                self.failed_attempts = 0
+
+            for path in self.flushing_journals:
+                os.remove(path)
+            self.flushing_journals.clear()
+            return len(batch)
+
+    def _save(self, records):
+        try:
+            # One transaction for the whole chunk; save() keeps the models' signals
+            with transaction.atomic():
+                for record in records:
+                    from_record(record).save()
+        except IntegrityError:
+            # A bad row (e.g. its user was deleted meanwhile) must not block the rest
+            for saved, record in enumerate(records):
+                try:
+                    with transaction.atomic():
+                        from_record(record).save()
+                except IntegrityError:
+                    logger.exception(f"Dropping write-behind {record['model']} row")
+                except Exception as error:
+                    # The rows before this one are committed, flush() skips them
+                    error.saved = saved
+                    raise
+
+    def close(self):
+        """
+        Stop accepting rows, save what is queued and stop the writer.
+        Registered with atexit so queued rows are saved on shutdown.
+        """
+        with self.condition:
+            if self.stopping:
+                return
+            self.stopping = True
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join()
+        else:
+            self.flush()
+        if self.journal is not None:
+            self.journal.close()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = WriteBehindBuffer(
+                max_size=getattr(settings, 'WRITE_BEHIND_QUEUE_SIZE', DEFAULT_QUEUE_SIZE),
+                batch_size=getattr(settings, 'WRITE_BEHIND_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+                flush_interval=getattr(settings, 'WRITE_BEHIND_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+                journal_dir=getattr(settings, 'WRITE_BEHIND_JOURNAL_DIR', None),
+                max_attempts=getattr(settings, 'WRITE_BEHIND_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS),
+            )
+            atexit.register(_buffer.close)
+        return _buffer
+
+
+def submit(instance):
+    """
+    Queue an unsaved instance to be saved by the write-behind writer.
+    Returns False when the queue is full and the caller should back off.
+    """
+    return get_buffer().submit(instance)
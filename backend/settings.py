@@ -97,6 +97,81 @@ USE_TZ = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Now works since 'os' is imported
 
+# Partial files of resumable examination uploads, kept outside MEDIA_ROOT
+CHUNKED_UPLOAD_DIR = os.path.join(BASE_DIR, 'uploads_partial')
+EXAMINATION_UPLOAD_MAX_BYTES = 1024 * 1024 * 1024
+# Unfinished upload sessions older than this are removed by purge_upload_sessions
+CHUNKED_UPLOAD_EXPIRY = timedelta(days=2)
+
+# Uploaded files are stored once per content and reference counted (api.storage)
+STORAGES = {
+    'default': {
+        'BACKEND': 'api.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Largest batch accepted by logs/bulk/
+LOG_BULK_MAX_ITEMS = 1000
+
+# users/provision/ batch limit and hashing processes (None: one per CPU)
+USER_PROVISION_MAX_ITEMS = 10000
+USER_PROVISION_HASH_WORKERS = None
+
+# Offload media transfers: None, 'x-accel-redirect' or 'x-sendfile'
+MEDIA_SENDFILE = None
+MEDIA_SENDFILE_PREFIX = '/protected-media/'
+
+# Upper bound for extracted STL files under MEDIA_ROOT/stl_files (LRU evicted)
+STL_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Threads running background jobs (recorded in JobRec)
+BACKGROUND_JOB_WORKERS = 2
+
+# Cached list counts; larger unfiltered tables report the database's estimate
+COUNT_CACHE_TTL = 30
+COUNT_ESTIMATE_THRESHOLD = 100000
+
+# Server-side cache and client max-age of the latest-version/ manifest
+LATEST_VERSION_CACHE_TTL = 300
+LATEST_VERSION_MAX_AGE = 60
+
+# bsdiff patches from earlier app versions (api.deltas)
+APP_VERSION_DELTA_SOURCES = 3
+APP_VERSION_DELTA_WORKERS = 1
+APP_VERSION_DELTA_MAX_FILE_SIZE = 64 * 1024 * 1024
+APP_VERSION_DELTA_MAX_RATIO = 0.8
+
+# GIF and WebP conversion of uploaded media (api.transcode)
+MEDIA_TRANSCODE_WORKERS = 2
+MEDIA_MAX_PIXELS = 4096 * 4096
+MEDIA_MAX_DIMENSION = 1024
+MEDIA_MAX_FRAMES = 500
+MEDIA_WEBP_QUALITY = 75
+
+# Monthly gzip archive of old logs and bugs (archive_old_rows)
+ARCHIVE_DIR = BASE_DIR / 'archive'
+ARCHIVE_RETENTION_DAYS = 180
+
+# Batched saving of bug, log and job record POSTs (api.writebehind)
+WRITE_BEHIND_ENABLED = False
+WRITE_BEHIND_QUEUE_SIZE = 10000
+WRITE_BEHIND_BATCH_SIZE = 500
+WRITE_BEHIND_FLUSH_INTERVAL = 0.5
+WRITE_BEHIND_JOURNAL_DIR = None
+WRITE_BEHIND_MAX_ATTEMPTS = 5
+
+# Per-process cache of JWT-authenticated users (api.authentication)
+AUTH_USER_CACHE_SIZE = 1024
+AUTH_USER_CACHE_TTL = 60
+
+# Per-process Bloom filter of blacklisted refresh tokens (api.blacklist)
+TOKEN_BLACKLIST_SYNC_INTERVAL = 1
+TOKEN_BLACKLIST_REBUILD_INTERVAL = 3600
+TOKEN_BLACKLIST_SYNC_OVERLAP = 100
+
 # Static files (CSS, JavaScript, Images)
 STATIC_URL = 'static/'
 
@@ -106,7 +181,8 @@ AUTH_USER_MODEL = 'api.User'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication with a per-process cache of authenticated users
+        'api.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,  # Change this value to set how many results per page